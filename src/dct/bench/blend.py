@@ -0,0 +1,87 @@
+"""Benchmark of HUD overlay blending strategies per frame.
+
+Run with ``python -m dct.bench.blend``.
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from dct.visualizations.hud import OVERLAY_PATH
+from dct.visualizations.util import AlphaBlender, apply_gradient
+
+RESOLUTIONS = ((480, 360), (640, 480))
+
+
+def legacy_blend(frame, overlay):
+    """Blend as HudOverlay did before AlphaBlender: RGBA conversion and float64 per channel."""
+    frame = cv2.cvtColor(frame, cv2.COLOR_RGB2RGBA)
+    gradient_alpha = overlay[:, :, 3] / 255.0
+
+    return apply_gradient(frame, overlay, gradient_alpha)
+
+
+def measure(blend, repeat):
+    blend()
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        blend()
+
+    return (time.perf_counter() - start) / repeat
+
+
+def run(resolutions=RESOLUTIONS, repeat=100):
+    """Measure the time per frame for each strategy and resolution.
+
+    Returns:
+        list: One result dict per (resolution, implementation).
+    """
+    results = []
+    source = cv2.imread(OVERLAY_PATH, cv2.IMREAD_UNCHANGED)
+    rng = np.random.RandomState(0)
+
+    for width, height in resolutions:
+        overlay = cv2.resize(source, (width, height))
+        frame = rng.randint(0, 256, (height, width, 3), dtype=np.uint8)
+
+        blender = AlphaBlender(overlay)
+        out = np.empty_like(frame)
+
+        implementations = (
+            ("apply_gradient", lambda: legacy_blend(frame, overlay)),
+            ("fixed_point", lambda: blender.blend(frame, out=out)),
+        )
+
+        for name, blend in implementations:
+            seconds = measure(blend, repeat)
+            results.append(
+                {
+                    "implementation": name,
+                    "width": width,
+                    "height": height,
+                    "ms_per_frame": seconds * 1e3,
+                    "coverage": blender.coverage if name == "fixed_point" else 1.0,
+                }
+            )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=100)
+    args = parser.parse_args()
+
+    print("{:<16} {:>11} {:>10} {:>9}".format("impl", "resolution", "ms/frame", "coverage"))
+    for result in run(repeat=args.repeat):
+        print(
+            "{implementation:<16} {resolution:>11} {ms_per_frame:>10.3f} {coverage:>9.2f}".format(
+                resolution="{width}x{height}".format(**result), **result
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Micro-benchmark comparing MJPEG frame extraction strategies.
+
+Run with ``python -m dct.bench.mjpeg``.
+"""
+import argparse
+import random
+import time
+
+from dct.camera.mjpeg import MJPEGParser, JPEG_SOI, JPEG_EOI
+
+# Maps every byte to a value below 0x80 so payloads never contain a marker.
+CLEAR_HIGH_BIT = bytes(i & 0x7F for i in range(256))
+
+
+def synthetic_stream(frames=300, frame_size=20 * 1024, boundary="frame", seed=0):
+    """Build a multipart MJPEG byte stream with JPEG-like payloads.
+
+    Payloads start and end with the JPEG markers and contain no other 0xff bytes,
+    which is enough for marker based extraction.
+    """
+    rng = random.Random(seed)
+    parts = []
+
+    for _ in range(frames):
+        size = max(16, int(rng.gauss(frame_size, frame_size / 10)))
+        body = rng.getrandbits(8 * (size - 4)).to_bytes(size - 4, "little")
+        payload = JPEG_SOI + body.translate(CLEAR_HIGH_BIT) + JPEG_EOI
+
+        parts.append("--{}\r\n".format(boundary).encode())
+        parts.append(b"Content-Type: image/jpeg\r\n")
+        parts.append("Content-Length: {}\r\n\r\n".format(len(payload)).encode())
+        parts.append(payload)
+        parts.append(b"\r\n")
+
+    return b"".join(parts)
+
+
+def split_chunks(data, chunk_size, seed=0):
+    """Split a stream in chunks of random size around chunk_size, like a network read."""
+    rng = random.Random(seed)
+    chunks = []
+    offset = 0
+
+    while offset < len(data):
+        size = rng.randint(max(1, chunk_size // 2), chunk_size * 3 // 2)
+        chunks.append(data[offset : offset + size])
+        offset += size
+
+    return chunks
+
+
+def legacy_extract(chunks):
+    """Frame extraction loop as used by DeepRacerMJPEGStream before MJPEGParser."""
+    frames = []
+    bytebuffer = bytes()
+
+    for chunk in chunks:
+        bytebuffer += chunk
+        a = bytebuffer.find(b"\xff\xd8")
+        b = bytebuffer.find(b"\xff\xd9")
+
+        if a != -1 and b != -1:
+            frames.append(bytebuffer[a : b + 2])
+            bytebuffer = bytebuffer[b + 2 :]
+
+    return frames
+
+
+def parser_extract(chunks):
+    frames = []
+    parser = MJPEGParser()
+
+    for chunk in chunks:
+        frames.extend(parser.feed(chunk))
+
+    return frames
+
+
+def measure(extract, chunks, repeat=5):
+    """Return the best wall time of repeat runs and the number of extracted frames."""
+    best = None
+    extracted = 0
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        extracted = len(extract(chunks))
+        elapsed = time.perf_counter() - start
+
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, extracted
+
+
+def run(frames=300, frame_size=20 * 1024, chunk_sizes=(1024, 8 * 1024, 64 * 1024), repeat=5):
+    """Run the benchmark for each chunk size.
+
+    Returns:
+        list: One result dict per (chunk size, implementation).
+    """
+    data = synthetic_stream(frames=frames, frame_size=frame_size)
+    results = []
+
+    for chunk_size in chunk_sizes:
+        chunks = split_chunks(data, chunk_size)
+
+        for name, extract in (("legacy", legacy_extract), ("parser", parser_extract)):
+            elapsed, extracted = measure(extract, chunks, repeat=repeat)
+            results.append(
+                {
+                    "implementation": name,
+                    "chunk_size": chunk_size,
+                    "frames": frames,
+                    "extracted": extracted,
+                    "seconds": elapsed,
+                    "us_per_frame": elapsed / frames * 1e6,
+                    "mb_per_second": len(data) / elapsed / 1e6,
+                }
+            )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--frame-size", type=int, default=20 * 1024)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(
+        "{:<8} {:>10} {:>10} {:>12} {:>10}".format(
+            "impl", "chunk", "extracted", "us/frame", "MB/s"
+        )
+    )
+    for result in run(frames=args.frames, frame_size=args.frame_size, repeat=args.repeat):
+        print(
+            "{implementation:<8} {chunk_size:>10} {extracted:>10} {us_per_frame:>12.1f} {mb_per_second:>10.1f}".format(
+                **result
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
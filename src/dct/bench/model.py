@@ -0,0 +1,69 @@
+"""Builds the small frozen graph bundled for benchmarks.
+
+The graph has the layout of a DeepRacer model (grayscale observation, convolutions,
+policy softmax) with fixed random weights, it is not a trained model. Regenerate
+the bundled files with ``python -m dct.bench.model``.
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+BENCH_MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "assets", "bench")
+
+
+def build(directory=BENCH_MODEL_PATH, seed=0):
+    """Write model.pb and model_metadata.json of the benchmark model into directory."""
+    import tensorflow.compat.v1 as tf
+
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.RandomState(seed)
+
+    graph = tf.Graph()
+    with graph.as_default():
+        # The first op is the input and the last op the output, see Model.
+        observation = tf.placeholder(tf.float32, [None, 120, 160, 1], name="observation")
+
+        layer = observation / 255.0
+        for i, (kernel, stride, channels) in enumerate([(8, 4, 8), (4, 2, 8)]):
+            weights = rng.randn(kernel, kernel, int(layer.shape[-1]), channels) * 0.1
+            layer = tf.nn.relu(
+                tf.nn.conv2d(
+                    layer,
+                    tf.constant(weights.astype(np.float32)),
+                    [1, stride, stride, 1],
+                    "SAME",
+                    name="Conv2d_{}".format(i),
+                )
+            )
+
+        flat = tf.reshape(layer, [-1, int(np.prod(layer.shape[1:]))])
+        weights = rng.randn(int(flat.shape[-1]), 5) * 0.01
+        tf.nn.softmax(tf.matmul(flat, tf.constant(weights.astype(np.float32))), name="policy")
+
+    with open(os.path.join(directory, "model.pb"), "wb") as f:
+        f.write(graph.as_graph_def().SerializeToString())
+
+    with open(os.path.join(directory, "model_metadata.json"), "w") as f:
+        json.dump(
+            {
+                "sensor": ["FRONT_FACING_CAMERA"],
+                "neural_network": "DEEP_CONVOLUTIONAL_NETWORK_SHALLOW",
+                "version": "3",
+            },
+            f,
+            indent=2,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory", nargs="?", default=BENCH_MODEL_PATH)
+    args = parser.parse_args()
+
+    build(args.directory)
+
+
+if __name__ == "__main__":
+    main()
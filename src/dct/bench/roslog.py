@@ -0,0 +1,156 @@
+"""Micro-benchmark comparing ROS log parsing strategies.
+
+Run with ``python -m dct.bench.roslog``, optionally replaying a log captured with
+``rostopic echo /rosout_agg/msg > rosout_agg.log`` on the car using ``--log``.
+"""
+import argparse
+import io
+import random
+import re
+import time
+
+from dct.bench.mjpeg import split_chunks
+from dct.util.roslog import RosLogParser
+
+# Typical verbose messages which do not contain telemetry.
+NOISE = [
+    "Camera frame published",
+    "Sensor fusion: received camera message at 15.0 fps",
+    "[navigation] Action space index 3 selected",
+    "Inference completed, action index: 2",
+    "Servo calibration loaded from /opt/aws/deepracer/calibration.json",
+]
+
+
+def synthetic_log(lines=100000, seed=0):
+    """Build `rostopic echo` output with mostly noise and some telemetry messages."""
+    rng = random.Random(seed)
+    parts = []
+
+    for i in range(lines):
+        if i % 5000 == 0:
+            message = "Model 'model-{}' is installed".format(i // 5000 % 3)
+        elif i % 5000 == 1:
+            message = "Inference task (pid: {}) has {}".format(
+                rng.randint(1000, 9999), rng.choice(["started", "stopped"])
+            )
+        elif rng.random() < 0.2:
+            message = "Setting throttle to {:.6f}".format(rng.random())
+        else:
+            message = rng.choice(NOISE)
+
+        parts.append('"{}"\n---\n'.format(message))
+
+    return "".join(parts).encode()
+
+
+def legacy_update(line):
+    """Line matching as done by DeepRacerCar before RosLogParser."""
+    if line == "---\n":
+        return None
+
+    line = line.lstrip('"').rstrip('"\n')
+
+    match = re.search(r"Inference task .* has (.*)", line)
+    if match:
+        return match[1] == "started"
+
+    match = re.search(r"Model '(.*)' is installed", line)
+    if match:
+        return match[1]
+
+    match = re.search(r"Setting throttle to (\d+\.\d+)", line)
+    if match:
+        return float(match[1]) * 100
+
+    return None
+
+
+def legacy_parse(data, chunk_size):
+    stdout = io.StringIO(data.decode())
+    events = 0
+
+    for line in iter(lambda: stdout.readline(2048), ""):
+        if legacy_update(line) is not None:
+            events += 1
+
+    return events
+
+
+def parser_parse(data, chunk_size):
+    parser = RosLogParser()
+    events = 0
+
+    for chunk in split_chunks(data, chunk_size):
+        events += len(parser.feed(chunk))
+
+    return events
+
+
+def measure(parse, data, chunk_size, repeat=5):
+    """Return the best wall time of repeat runs and the number of events."""
+    best = None
+    events = 0
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        events = parse(data, chunk_size)
+        elapsed = time.perf_counter() - start
+
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, events
+
+
+def run(data=None, lines=100000, chunk_size=64 * 1024, repeat=5):
+    """Run the benchmark on a captured log, or a synthetic one if data is None.
+
+    Returns:
+        list: One result dict per implementation.
+    """
+    if data is None:
+        data = synthetic_log(lines=lines)
+
+    line_count = data.count(b"\n")
+    results = []
+
+    for name, parse in (("legacy", legacy_parse), ("parser", parser_parse)):
+        elapsed, events = measure(parse, data, chunk_size, repeat=repeat)
+        results.append(
+            {
+                "implementation": name,
+                "lines": line_count,
+                "events": events,
+                "seconds": elapsed,
+                "us_per_line": elapsed / line_count * 1e6,
+                "mb_per_second": len(data) / elapsed / 1e6,
+            }
+        )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log", help="Captured rosout_agg log to replay.")
+    parser.add_argument("--lines", type=int, default=100000)
+    parser.add_argument("--chunk-size", type=int, default=64 * 1024)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    data = None
+    if args.log:
+        with open(args.log, "rb") as f:
+            data = f.read()
+
+    print("{:<8} {:>10} {:>8} {:>10} {:>10}".format("impl", "lines", "events", "us/line", "MB/s"))
+    for result in run(data, lines=args.lines, chunk_size=args.chunk_size, repeat=args.repeat):
+        print(
+            "{implementation:<8} {lines:>10} {events:>8} {us_per_line:>10.2f} {mb_per_second:>10.1f}".format(
+                **result
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""Benchmark suite of the streaming pipeline with a JSON report.
+
+Run with ``dct bench`` or ``python -m dct.bench.suite``. Reports of different
+commits can be compared with ``--compare``.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import types
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+from dct.bench.blend import legacy_blend
+from dct.bench.mjpeg import split_chunks, synthetic_stream
+from dct.bench.model import BENCH_MODEL_PATH
+from dct.camera.stream import DeepRacerMJPEGStream
+from dct.stream.broadcaster import Broadcaster
+from dct.stream.streaming import StreamingClient
+from dct.util.model import Model, ModelMetadata
+from dct.util.simulator import synthetic_frames
+from dct.visualizations.gradcam import GradCam
+from dct.visualizations.hud import OVERLAY_PATH, HudOverlay
+from dct.visualizations.util import get_font, write_text_on_image
+
+# Version of the report layout, increase when keys change meaning.
+REPORT_SCHEMA = 1
+
+WIDTH = 480
+HEIGHT = 360
+
+
+def timings(function, iterations, warmup=3):
+    """Wall time of each call of function in seconds, after warmup calls."""
+    for _ in range(warmup):
+        function()
+
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+
+    return samples
+
+
+def summary(samples, unit="ms", scale=1e3, **extra):
+    """Statistics of timing samples as stored in the report."""
+    samples = np.asarray(samples) * scale
+
+    result = {
+        "unit": unit,
+        "iterations": len(samples),
+        "median": float(np.median(samples)),
+        "mean": float(np.mean(samples)),
+        "p90": float(np.percentile(samples, 90)),
+        "min": float(np.min(samples)),
+    }
+    result.update(extra)
+
+    return result
+
+
+def camera_frame(width=WIDTH, height=HEIGHT):
+    """Camera-like BGR frame, smooth gradients with some noise."""
+    frame = synthetic_frames(width, height, count=1)[0]
+    noise = np.random.RandomState(0).randint(0, 16, frame.shape, dtype=np.uint8)
+
+    return cv2.add(frame, noise)
+
+
+def bench_mjpeg_parse(iterations):
+    frames = 100
+    chunks = split_chunks(synthetic_stream(frames=frames), 64 * 1024)
+    response = types.SimpleNamespace(iter_content=lambda chunk_size: iter(chunks))
+
+    # read_frames is what process_frames runs on the car response.
+    stream = DeepRacerMJPEGStream.__new__(DeepRacerMJPEGStream)
+    stream.chunk_size = 64 * 1024
+
+    samples = timings(lambda: sum(1 for _ in stream.read_frames(response)), iterations)
+
+    return summary([sample / frames for sample in samples], unit="us", scale=1e6, frames=frames)
+
+
+def bench_imdecode(iterations):
+    jpeg = np.frombuffer(cv2.imencode(".jpg", camera_frame())[1].tobytes(), dtype=np.uint8)
+
+    return summary(timings(lambda: cv2.imdecode(jpeg, cv2.IMREAD_COLOR), iterations), bytes=len(jpeg))
+
+
+def bench_imencode(iterations):
+    frame = camera_frame()
+
+    return summary(timings(lambda: cv2.imencode(".jpg", frame), iterations))
+
+
+def bench_hud_overlay(iterations):
+    car = types.SimpleNamespace(name="Car 1", model_name="model", car_driving=True, throttle=42.0)
+    hud = HudOverlay(car)
+
+    frame = camera_frame()
+    frame.flags.writeable = False  # Frames are shared between visualizers.
+
+    return summary(timings(lambda: hud.frame(frame), iterations))
+
+
+def bench_apply_gradient(iterations):
+    overlay = cv2.resize(cv2.imread(OVERLAY_PATH, cv2.IMREAD_UNCHANGED), (WIDTH, HEIGHT))
+    frame = camera_frame()
+
+    return summary(timings(lambda: legacy_blend(frame, overlay), iterations))
+
+
+def bench_write_text(iterations):
+    font = get_font("AmazonEmber-Regular", 16)
+    frame = camera_frame()
+
+    return summary(
+        timings(
+            lambda: write_text_on_image(frame, "Speed 42%", (7, 332), font, (255, 255, 255), (26, 26, 26)),
+            iterations,
+        )
+    )
+
+
+def bench_gradcam(iterations):
+    model = Model.from_file(
+        os.path.join(BENCH_MODEL_PATH, "model.pb"),
+        ModelMetadata.from_file(os.path.join(BENCH_MODEL_PATH, "model_metadata.json")),
+    )
+    cam = GradCam.for_model(model)
+    frame = camera_frame()
+
+    return summary(timings(lambda: cam.process(frame), iterations))
+
+
+class InMemoryStreamingClient(StreamingClient):
+    """Counts what a viewer would receive, no sockets involved."""
+
+    def __init__(self):
+        super().__init__()
+        self.received = 0
+
+    def transmit(self, buffers):
+        sent = super().transmit(buffers)
+        self.received += sent
+        return sent
+
+
+def bench_broadcaster(iterations, clients=16):
+    broadcaster = Broadcaster(source=None)
+    viewers = [InMemoryStreamingClient() for _ in range(clients)]
+    for viewer in viewers:
+        # Viewers fall behind while waiting for the GIL, never skip frames here.
+        viewer.maxLag = broadcaster.frames.capacity
+        broadcaster.addClient(viewer)
+        viewer.start()
+
+    jpeg = cv2.imencode(".jpg", camera_frame())[1].tobytes()
+
+    def fan_out():
+        # Time until every viewer has sent the frame.
+        sequence = broadcaster.frames.head
+        broadcaster.broadcast(broadcaster.prepare_frame(jpeg))
+
+        while any(viewer.cursor <= sequence for viewer in viewers):
+            time.sleep(0)
+
+    samples = timings(fan_out, iterations)
+
+    for viewer in viewers:
+        viewer.connected = False
+
+    return summary(samples, clients=clients, bytes=len(jpeg))
+
+
+BENCHMARKS = {
+    "mjpeg_parse": bench_mjpeg_parse,
+    "imdecode": bench_imdecode,
+    "imencode": bench_imencode,
+    "hud_overlay": bench_hud_overlay,
+    "apply_gradient": bench_apply_gradient,
+    "write_text_on_image": bench_write_text,
+    "gradcam_process": bench_gradcam,
+    "broadcaster_fan_out": bench_broadcaster,
+}
+
+
+def environment():
+    """Versions and hardware of the machine running the suite."""
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "tensorflow": tf.__version__,
+    }
+
+    try:
+        info["commit"] = (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"],
+                cwd=os.path.dirname(__file__),
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except Exception:
+        info["commit"] = None
+
+    return info
+
+
+def run(names=None, iterations=50):
+    """Run the benchmarks and build the report.
+
+    Args:
+        names (list, optional): Benchmarks to run, all if None.
+        iterations (int): Timed calls per benchmark.
+
+    Returns:
+        dict: Report with the environment and a result per benchmark.
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        results[name] = BENCHMARKS[name](iterations)
+
+    return {
+        "schema": REPORT_SCHEMA,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": environment(),
+        "iterations": iterations,
+        "results": results,
+    }
+
+
+def compare(report, baseline):
+    """Change of the median of every benchmark relative to a baseline report.
+
+    Returns:
+        dict: Ratio current / baseline per benchmark present in both reports.
+    """
+    return {
+        name: result["median"] / baseline["results"][name]["median"]
+        for name, result in report["results"].items()
+        if name in baseline["results"] and baseline["results"][name]["median"] > 0
+    }
+
+
+def print_report(report, baseline=None):
+    ratios = compare(report, baseline) if baseline is not None else {}
+
+    print("{:<22} {:>10} {:>10} {:>10} {:>8}".format("benchmark", "median", "p90", "unit", "change"))
+    for name, result in report["results"].items():
+        change = "{:+.1f}%".format((ratios[name] - 1) * 100) if name in ratios else ""
+        print(
+            "{:<22} {:>10.3f} {:>10.3f} {:>10} {:>8}".format(
+                name, result["median"], result["p90"], result["unit"], change
+            )
+        )
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS), help="Run only these benchmarks.")
+    parser.add_argument("--output", help="Write the JSON report to this file.")
+    parser.add_argument("--compare", help="JSON report of an earlier run to compare with.")
+    args = parser.parse_args(args)
+
+    report = run(args.only, iterations=args.iterations)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
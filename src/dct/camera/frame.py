@@ -0,0 +1,85 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+class Frame:
+    """Camera frame shared by all consumers of a stream.
+
+    The frame keeps the compressed JPEG bytes as received from the car and only
+    decodes them when a consumer asks for the image. Decoding happens at most once,
+    the resulting array is read-only and shared, consumers that want to draw on it
+    should use `writable` to get their own copy.
+
+    Telemetry of the car at the arrival time of the frame is looked up on first use,
+    which is usually well after arrival so log messages which arrived later than the
+    frame are taken into account.
+    """
+
+    __slots__ = (
+        "jpeg",
+        "timestamp",
+        "sequence",
+        "series",
+        "capture",
+        "trace",
+        "_telemetry",
+        "_image",
+        "_lock",
+    )
+
+    def __init__(self, jpeg, timestamp, sequence, series=None, telemetry=None, capture=None, trace=None):
+        self.jpeg = jpeg  # Original JPEG bytes (or a buffer of them) as received from the car.
+        self.timestamp = timestamp  # Arrival time of the frame.
+        self.sequence = sequence  # Frame number within the source stream.
+        self.series = series  # TelemetrySeries of the car which captured the frame.
+        self.capture = capture  # Capture time reported by the car, None if unknown.
+        self.trace = trace  # FrameTrace when tracing is enabled.
+
+        self._telemetry = telemetry  # Already aligned TelemetrySample, e.g. from a recording.
+        self._image = None
+        self._lock = threading.Lock()
+
+    @property
+    def telemetry(self):
+        """TelemetrySample aligned with the frame, None if unknown."""
+        if self._telemetry is None and self.series is not None:
+            self._telemetry = self.series.at(self.timestamp)
+
+        return self._telemetry
+
+    @property
+    def decoded(self):
+        return self._image is not None
+
+    @property
+    def image(self):
+        """Decoded BGR image, read-only and shared with all other consumers."""
+        if self._image is None:
+            with self._lock:
+                if self._image is None:
+                    image = cv2.imdecode(
+                        np.frombuffer(self.jpeg, dtype=np.uint8), cv2.IMREAD_COLOR
+                    )
+                    image.flags.writeable = False
+                    self._image = image
+
+        return self._image
+
+    def writable_image(self):
+        """Private copy of the decoded image which may be modified."""
+        return self.image.copy()
+
+
+def writable(image):
+    """Copy-on-write helper for overlays: returns the image itself if it may be
+    modified in place, otherwise a copy of it.
+
+    Args:
+        image (numpy.ndarray): Image passed to an overlay.
+
+    Returns:
+        numpy.ndarray: Image which can be drawn on.
+    """
+    return image if image.flags.writeable else image.copy()
@@ -0,0 +1,125 @@
+import re
+
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+
+CONTENT_LENGTH = re.compile(rb"content-length:[ \t]*(\d+)", re.IGNORECASE)
+# Capture time of the image as sent by the ROS web_video_server, in seconds.
+X_TIMESTAMP = re.compile(rb"x-timestamp:[ \t]*(\d+(?:\.\d*)?)", re.IGNORECASE)
+MAX_HEADER_SIZE = 4096
+
+
+class MJPEGParser:
+    """Incremental parser which extracts JPEG frames from a multipart MJPEG byte stream.
+
+    Chunks are appended to a single bytearray which is only scanned from the last
+    resume offset, so markers split across chunks are found without rescanning
+    data seen before. Every complete frame in a chunk is returned. When a part
+    header contains a Content-Length the frame is sliced directly instead of
+    searching for the end of image marker.
+
+    The capture time in the X-Timestamp part header of every frame returned by the
+    last call of feed is kept in capture_times, None for frames without one.
+    """
+
+    def __init__(self, max_frame_size=10 * 1024 * 1024):
+        self.buffer = bytearray()
+        self.max_frame_size = max_frame_size
+
+        self.scan_offset = 0  # Position to resume searching for the next marker.
+        self.frame_start = -1  # Start of image marker of the frame in progress.
+        self.content_length = None  # Content-Length of the frame in progress.
+        self.capture_time = None  # X-Timestamp of the frame in progress.
+        self.capture_times = []
+
+    def reset(self):
+        self.buffer = bytearray()
+        self.scan_offset = 0
+        self.frame_start = -1
+        self.content_length = None
+        self.capture_time = None
+        self.capture_times = []
+
+    def feed(self, chunk):
+        """Add a chunk of the stream and extract all frames which are complete.
+
+        Args:
+            chunk (bytes): Bytes received from the stream.
+
+        Returns:
+            list: JPEG encoded frames (bytes) completed by this chunk, in stream order.
+        """
+        buffer = self.buffer
+        buffer += chunk
+
+        frames = []
+        self.capture_times = []
+        consumed = 0
+
+        with memoryview(buffer) as view:
+            while True:
+                if self.frame_start < 0:
+                    start = buffer.find(JPEG_SOI, self.scan_offset)
+
+                    if start == -1:
+                        # Keep the part header and a trailing 0xff which might be half a marker.
+                        self.scan_offset = max(consumed, len(buffer) - 1)
+                        if len(buffer) - consumed > MAX_HEADER_SIZE:
+                            consumed = self.scan_offset
+                        break
+
+                    # Only the part header between the previous frame and this one can hold the length.
+                    match = CONTENT_LENGTH.search(buffer, consumed, start)
+                    self.content_length = int(match.group(1)) if match else None
+                    if self.content_length is not None and self.content_length > self.max_frame_size:
+                        self.content_length = None
+
+                    match = X_TIMESTAMP.search(buffer, consumed, start)
+                    self.capture_time = float(match.group(1)) if match else None
+                    self.frame_start = start
+                    self.scan_offset = start + len(JPEG_SOI)
+
+                start = self.frame_start
+                end = -1
+
+                if self.content_length is not None:
+                    if len(buffer) < start + self.content_length:
+                        break
+
+                    candidate = start + self.content_length
+                    if view[candidate - len(JPEG_EOI) : candidate] == JPEG_EOI:
+                        end = candidate
+                    else:
+                        # Length does not match the payload, fall back to scanning for the marker.
+                        self.content_length = None
+
+                if end == -1:
+                    eoi = buffer.find(JPEG_EOI, self.scan_offset)
+
+                    if eoi == -1:
+                        if len(buffer) - start > self.max_frame_size:
+                            # Drop a frame which never ends instead of growing without bound.
+                            consumed = len(buffer)
+                            self.frame_start = -1
+
+                        self.scan_offset = max(self.scan_offset, len(buffer) - 1)
+                        break
+
+                    end = eoi + len(JPEG_EOI)
+
+                frames.append(bytes(view[start:end]))
+                self.capture_times.append(self.capture_time)
+
+                consumed = end
+                self.scan_offset = end
+                self.frame_start = -1
+                self.content_length = None
+
+        if consumed > 0:
+            # Compact once per chunk rather than once per frame.
+            del buffer[:consumed]
+            self.scan_offset -= consumed
+            if self.frame_start >= 0:
+                self.frame_start -= consumed
+
+        return frames
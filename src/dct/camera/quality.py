@@ -0,0 +1,224 @@
+"""Adaptive source quality of a camera feed.
+
+The car encodes the camera feed at the quality and resolution requested in the
+feed URL and queues frames it cannot send fast enough, so on a congested link the
+stream falls behind and the framerate drops. QualityController watches the
+framerate, the jitter between frames and the delay since capture, and moves the
+feed down a ladder of cheaper settings when the link degrades and back up once it
+has recovered.
+"""
+import collections
+import math
+
+import numpy as np
+
+SourceSettings = collections.namedtuple("SourceSettings", ["width", "height", "quality"])
+
+
+def quality_ladder(width, height, quality, min_quality=20, min_scale=0.5):
+    """Source settings from the configured ones down to the cheapest.
+
+    The JPEG quality is lowered first, as it saves most data for the least visible
+    loss, then the resolution is reduced at the lowest quality.
+
+    Args:
+        width (int): Configured width.
+        height (int): Configured height.
+        quality (int): Configured JPEG quality.
+        min_quality (int): Lowest JPEG quality to use.
+        min_scale (float): Smallest fraction of the configured resolution to use.
+
+    Returns:
+        list: SourceSettings, the configured settings first.
+    """
+    ladder = [SourceSettings(width, height, quality)]
+
+    level = quality
+    while int(level * 0.75) >= min_quality:
+        level = int(level * 0.75)
+        ladder.append(SourceSettings(width, height, level))
+
+    if level > min_quality:
+        ladder.append(SourceSettings(width, height, min_quality))
+
+    scale = 0.75
+    while scale >= min_scale:
+        # Keep dimensions a multiple of 8, the JPEG block size.
+        ladder.append(
+            SourceSettings(
+                max(8, int(width * scale) // 8 * 8),
+                max(8, int(height * scale) // 8 * 8),
+                ladder[-1].quality,
+            )
+        )
+        scale -= 0.25
+
+    return ladder
+
+
+class QualityController:
+    """Chooses the settings of a camera feed from the frames it receives.
+
+    Frames are measured in windows of one second. A window is degraded when the
+    framerate is below min_fps, the standard deviation of the time between frames
+    is above max_jitter or frames arrive more than max_delay later after capture
+    than the quickest frame of the connection (the car is queueing frames).
+    After `patience` degraded windows in a row the feed moves one step down the
+    ladder. At the bottom it reconnects at the same settings to drop the frames
+    queued on the car, unless capture times show the car is not queueing. The
+    stream backs off between such reconnects until a window is no longer degraded.
+
+    The feed moves one step up after recover_time seconds of healthy windows, which
+    also need a framerate close to the best seen and half the jitter. When the link
+    degrades again shortly after a step up, recover_time is doubled up to
+    max_recover_time so the feed does not keep switching on a marginal link.
+
+    Args:
+        ladder (list): SourceSettings from best to cheapest, see quality_ladder.
+        min_fps (float): Minimum framerate of a healthy feed.
+        max_jitter (float): Maximum standard deviation of frame intervals in seconds.
+        max_delay (float): Maximum extra delay since capture in seconds, only used
+            when the car sends capture times.
+        patience (int): Degraded windows in a row before stepping down.
+        recover_time (float): Seconds of healthy windows before stepping up.
+        max_recover_time (float): Upper bound of recover_time after failed steps up.
+    """
+
+    def __init__(
+        self,
+        ladder,
+        min_fps=10.0,
+        max_jitter=0.15,
+        max_delay=1.0,
+        patience=2,
+        recover_time=10.0,
+        max_recover_time=300.0,
+    ):
+        self.ladder = ladder
+        self.level = 0  # Position in the ladder, 0 is the configured settings.
+
+        self.min_fps = min_fps
+        self.max_jitter = max_jitter
+        self.max_delay = max_delay
+        self.patience = patience
+        self.initial_recover_time = recover_time
+        self.recover_time = recover_time
+        self.max_recover_time = max_recover_time
+
+        self.framerate = None  # Framerate of the last window, None until measured.
+        self.jitter = None  # Standard deviation of frame intervals of the last window.
+        self.delay = None  # Extra delay since capture of the last window.
+        self.best_framerate = 0.0
+
+        self.degraded = 0  # Degraded windows in a row.
+        self.healthy_since = None  # Start of the healthy windows in a row.
+        self.stepped_up = None  # Time of the last step up.
+
+        self.connected()
+
+    @property
+    def settings(self):
+        return self.ladder[self.level]
+
+    def connected(self):
+        """Start measuring a new connection of the feed."""
+        self.window_start = None
+        self.last_frame = None
+        self.intervals = []
+        self.delays = []
+        self.min_delay = math.inf
+        self.stable = False  # The last window of this connection was not degraded.
+
+    def disconnected(self):
+        """The feed was lost, the framerate has to be measured again."""
+        self.framerate = None
+        self.degraded = 0
+        self.healthy_since = None
+
+    def observe(self, timestamp, capture=None):
+        """Measure a frame which arrived at timestamp.
+
+        Args:
+            timestamp (float): Arrival time of the frame.
+            capture (float, optional): Capture time reported by the car.
+
+        Returns:
+            SourceSettings: Settings to reconnect the feed with, None to continue.
+        """
+        if self.last_frame is None:
+            # First frame of the connection.
+            self.window_start = timestamp
+        else:
+            self.intervals.append(timestamp - self.last_frame)
+        self.last_frame = timestamp
+
+        if capture is not None:
+            delay = timestamp - capture
+            self.min_delay = min(self.min_delay, delay)
+            self.delays.append(delay - self.min_delay)
+
+        if timestamp - self.window_start <= 1:
+            return None
+
+        return self.evaluate(timestamp)
+
+    def evaluate(self, now):
+        self.framerate = len(self.intervals) / (now - self.window_start)
+        self.jitter = float(np.std(self.intervals)) if self.intervals else 0.0
+        self.delay = float(np.median(self.delays)) if self.delays else None
+        self.best_framerate = max(self.best_framerate, self.framerate)
+
+        start, self.window_start = self.window_start, now
+        self.intervals = []
+        self.delays = []
+
+        queueing = self.delay is not None and self.delay > self.max_delay
+
+        if self.framerate < self.min_fps or self.jitter > self.max_jitter or queueing:
+            self.degraded += 1
+            self.healthy_since = None
+            self.stable = False
+
+            if self.degraded < self.patience:
+                return None
+
+            if self.level == len(self.ladder) - 1 and self.delay is not None and not queueing:
+                # Nothing cheaper to ask for and no frames queued on the car to drop.
+                self.degraded = 0
+                return None
+
+            if self.stepped_up is not None and now - self.stepped_up < self.recover_time:
+                # The step up did not hold, wait longer before trying again.
+                self.recover_time = min(self.recover_time * 2, self.max_recover_time)
+            self.stepped_up = None
+
+            return self.change(min(self.level + 1, len(self.ladder) - 1))
+
+        self.degraded = 0
+        self.stable = True
+
+        healthy = self.framerate >= max(self.min_fps, 0.9 * self.best_framerate) and self.jitter <= self.max_jitter / 2
+        if not healthy:
+            self.healthy_since = None
+            return None
+
+        if self.healthy_since is None:
+            self.healthy_since = start
+
+        if self.stepped_up is not None and now - self.stepped_up >= self.recover_time:
+            # The last step up held.
+            self.recover_time = self.initial_recover_time
+            self.stepped_up = None
+
+        if self.level > 0 and now - self.healthy_since >= self.recover_time:
+            self.stepped_up = now
+            return self.change(self.level - 1)
+
+        return None
+
+    def change(self, level):
+        self.level = level
+        self.degraded = 0
+        self.healthy_since = None
+
+        return self.settings
@@ -0,0 +1,191 @@
+"""Recording of the original camera frames of a stream.
+
+A recording is a directory of numbered segments, each consisting of three files:
+
+- ``<n>.mjpeg``: the JPEG frames as received from the car, back to back.
+- ``<n>.idx``: one INDEX_DTYPE record (timestamp, offset, length) per frame.
+- ``<n>.tel``: one TELEMETRY_DTYPE record per frame with the telemetry of the car
+  at the arrival time of the frame, NaN when unknown.
+"""
+import collections
+import logging
+import os
+import threading
+
+import numpy as np
+
+INDEX_DTYPE = np.dtype([("timestamp", "<f8"), ("offset", "<u8"), ("length", "<u4")])
+TELEMETRY_DTYPE = np.dtype(
+    [("timestamp", "<f8"), ("throttle", "<f4"), ("driving", "<f4"), ("battery", "<f4")]
+)
+
+SEGMENT_EXTENSION = ".mjpeg"
+INDEX_EXTENSION = ".idx"
+TELEMETRY_EXTENSION = ".tel"
+
+
+def segment_paths(directory, number):
+    """Paths of the frame, index and telemetry files of a segment."""
+    base = os.path.join(directory, "{:06d}".format(number))
+    return base + SEGMENT_EXTENSION, base + INDEX_EXTENSION, base + TELEMETRY_EXTENSION
+
+
+def list_segments(directory):
+    """Numbers of the segments in a recording, in order."""
+    return sorted(
+        int(name[: -len(SEGMENT_EXTENSION)])
+        for name in os.listdir(directory)
+        if name.endswith(SEGMENT_EXTENSION)
+    )
+
+
+def read_index(path):
+    """Read a segment index into a structured array with INDEX_DTYPE."""
+    # Ignore a partially written last record.
+    size = os.path.getsize(path) // INDEX_DTYPE.itemsize
+    return np.fromfile(path, dtype=INDEX_DTYPE, count=size)
+
+
+class StreamRecorder:
+    """Stream consumer which records the original JPEG frames without re-encoding.
+
+    notify() only queues the frame, a background thread writes the queued frames in
+    batches so the ingest loop never waits for the disk. Segments are rotated once
+    they exceed segment_size bytes. If the disk cannot keep up more than max_pending
+    frames, new frames are dropped and counted.
+
+    Args:
+        directory (str): Directory of the recording, created if missing.
+        segment_size (int): Size in bytes after which a new segment is started.
+        max_pending (int): Maximum number of frames waiting to be written.
+    """
+
+    def __init__(self, directory, segment_size=256 * 1024 ** 2, max_pending=256):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_pending = max_pending
+
+        self.pending = collections.deque()
+        self.condition = threading.Condition()
+        self.closed = False
+
+        self.segment = None  # Number of the segment being written.
+        self.files = None
+        self.offset = 0  # Size of the current segment.
+
+        self.recorded = 0  # Frames written.
+        self.dropped = 0  # Frames dropped because the writer fell behind.
+
+        self.writerThread = threading.Thread(target=self.write_frames)
+        self.writerThread.daemon = True
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.writerThread.start()
+
+    def notify(self, frame):
+        # The stream publishes None when it disconnects, the recording continues.
+        if frame is None:
+            return
+
+        with self.condition:
+            if len(self.pending) >= self.max_pending:
+                self.dropped += 1
+                return
+
+            self.pending.append(frame)
+            self.condition.notify()
+
+    def depth(self):
+        """Number of frames waiting to be written."""
+        return len(self.pending)
+
+    def close(self):
+        """Write the remaining frames and close the current segment."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+        if self.writerThread.is_alive():
+            self.writerThread.join()
+
+    def open_segment(self):
+        self.close_segment()
+
+        segments = list_segments(self.directory)
+        self.segment = segments[-1] + 1 if segments else 0
+        self.files = [
+            open(path, "wb", buffering=1024 * 1024)
+            for path in segment_paths(self.directory, self.segment)
+        ]
+        self.offset = 0
+
+        logging.debug("Recording segment {} in {}".format(self.segment, self.directory))
+
+    def close_segment(self):
+        if self.files is not None:
+            for f in self.files:
+                f.close()
+
+            self.files = None
+
+    def write_frames(self):
+        try:
+            while True:
+                with self.condition:
+                    self.condition.wait_for(lambda: self.pending or self.closed)
+
+                    batch = list(self.pending)
+                    self.pending.clear()
+
+                    if not batch and self.closed:
+                        return
+
+                try:
+                    self.write_batch(batch)
+                except Exception as e:
+                    print(e)
+        finally:
+            self.close_segment()
+
+    def write_batch(self, batch):
+        start = 0
+        while start < len(batch):
+            if self.files is None or self.offset >= self.segment_size:
+                self.open_segment()
+
+            # Frames which fit in the current segment, at least one.
+            end = start
+            size = self.offset
+            while end < len(batch) and (end == start or size < self.segment_size):
+                size += len(batch[end].jpeg)
+                end += 1
+
+            frames = batch[start:end]
+            index = np.zeros(len(frames), dtype=INDEX_DTYPE)
+            telemetry = np.full(len(frames), np.nan, dtype=TELEMETRY_DTYPE)
+
+            for i, frame in enumerate(frames):
+                index[i] = (frame.timestamp, self.offset, len(frame.jpeg))
+                self.offset += len(frame.jpeg)
+
+                telemetry["timestamp"][i] = frame.timestamp
+                sample = frame.telemetry
+                if sample is not None:
+                    for name in ("throttle", "driving", "battery"):
+                        value = getattr(sample, name)
+                        if value is not None:
+                            telemetry[name][i] = value
+
+            segment, index_file, telemetry_file = self.files
+            segment.writelines(frame.jpeg for frame in frames)
+            segment.flush()
+
+            # Index after the frames, so an index entry never points past the data.
+            index_file.write(index.tobytes())
+            index_file.flush()
+            telemetry_file.write(telemetry.tobytes())
+            telemetry_file.flush()
+
+            self.recorded += len(frames)
+            start = end
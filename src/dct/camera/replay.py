@@ -0,0 +1,186 @@
+import logging
+import math
+import mmap
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from dct.camera.frame import Frame
+from dct.camera.recorder import (
+    TELEMETRY_DTYPE,
+    list_segments,
+    read_index,
+    segment_paths,
+)
+from dct.camera.stream import BaseStream
+from dct.util import tracing
+from dct.util.telemetry import TelemetrySample
+
+
+class ReplayCar:
+    """Stand-in for DeepRacerCar when replaying, so overlays can be used without a car.
+
+    Telemetry is taken from the replayed frames, the attributes are only used by
+    overlays as fallback.
+    """
+
+    def __init__(self, name="Replay"):
+        self.name = name
+        self.model_name = None
+        self.throttle = None
+        self.car_driving = None
+        self.battery_level = None
+
+
+class RecordedSegment:
+    """A recorded segment mapped into memory, frames are slices of the mapping."""
+
+    def __init__(self, directory, number):
+        segment_path, index_path, telemetry_path = segment_paths(directory, number)
+
+        self.index = read_index(index_path)
+        self.telemetry = np.fromfile(telemetry_path, dtype=TELEMETRY_DTYPE)[: len(self.index)]
+
+        self.file = open(segment_path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.data = memoryview(mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b"")
+
+        # Frames which were not completely written are left out.
+        if len(self.index):
+            complete = self.index["offset"] + self.index["length"] <= size
+            self.index = self.index[complete]
+
+    def __len__(self):
+        return len(self.index)
+
+    def jpeg(self, i):
+        offset, length = int(self.index["offset"][i]), int(self.index["length"][i])
+        return self.data[offset : offset + length]
+
+    def sample(self, i):
+        """TelemetrySample recorded with frame i, None if nothing was known."""
+        if i >= len(self.telemetry):
+            return None
+
+        values = [float(value) for value in self.telemetry[i].tolist()]
+        if all(math.isnan(value) for value in values[1:]):
+            return None
+
+        return TelemetrySample(*(None if math.isnan(value) else value for value in values))
+
+
+class ReplayStream(BaseStream):
+    """Replays a recording made by StreamRecorder as if the car was streaming.
+
+    Segments are memory mapped and frames are published as zero-copy slices of the
+    mapping, with the telemetry recorded alongside them. Frames get the replay time
+    as arrival time.
+
+    Args:
+        directory (str): Recording directory of a single car.
+        speed (float): Playback speed, 1 is real time, 0 replays as fast as possible.
+        loop (bool): Start over at the end of the recording instead of stopping.
+    """
+
+    def __init__(self, directory, speed=1.0, loop=False):
+        super().__init__()
+
+        if speed < 0:
+            raise ValueError("Replay speed should be positive, or 0 for as fast as possible")
+
+        self.directory = directory
+        self.name = os.path.basename(os.path.normpath(directory))
+        self.speed = speed
+        self.loop = loop
+
+        self.segments = [
+            RecordedSegment(directory, number) for number in list_segments(directory)
+        ]
+        self.segments = [segment for segment in self.segments if len(segment)]
+        if not self.segments:
+            raise ValueError("No recorded frames in {}".format(directory))
+
+        self.sequence = 0  # Number of frames published.
+        self.kill = False
+
+        self.replayThread = threading.Thread(target=self.process_frames)
+        self.replayThread.daemon = True
+
+        first = cv2.imdecode(np.frombuffer(self.segments[0].jpeg(0), dtype=np.uint8), cv2.IMREAD_COLOR)
+        self.video_height, self.video_width = first.shape[:2]
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments)
+
+    def start(self):
+        self.replayThread.start()
+        logging.debug("Starting replay thread for stream {}".format(self.identifier))
+
+    def stop(self):
+        self.kill = True
+
+    def frames(self):
+        """All recorded frames as (recorded timestamp, segment, position) in order."""
+        for segment in self.segments:
+            for i, timestamp in enumerate(segment.index["timestamp"].tolist()):
+                yield timestamp, segment, i
+
+    def replay(self):
+        """Publish the recording once, paced by the recorded timestamps."""
+        start_time = time.time()
+        start_timestamp = None
+
+        for timestamp, segment, i in self.frames():
+            if self.kill:
+                return
+
+            if start_timestamp is None:
+                start_timestamp = timestamp
+
+            if self.speed > 0:
+                delay = start_time + (timestamp - start_timestamp) / self.speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+            self.publish_frame(
+                Frame(
+                    segment.jpeg(i),
+                    time.time(),
+                    self.sequence,
+                    telemetry=segment.sample(i),
+                    trace=tracing.TRACER.start(),
+                )
+            )
+            self.sequence += 1
+
+    def process_frames(self):
+        try:
+            while not self.kill:
+                self.replay()
+
+                if not self.loop:
+                    break
+        except Exception as e:
+            print(e)
+        finally:
+            # Notify no frame is sent.
+            self.publish_frame(None)
+
+    @property
+    def fps(self):
+        timestamps = np.concatenate([segment.index["timestamp"] for segment in self.segments])
+        if len(timestamps) < 2 or timestamps[-1] <= timestamps[0]:
+            return None
+
+        return (len(timestamps) - 1) / (timestamps[-1] - timestamps[0])
+
+    @property
+    def width(self):
+        return self.video_width
+
+    @property
+    def height(self):
+        return self.video_height
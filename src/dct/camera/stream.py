@@ -1,5 +1,3 @@
-import cv2
-import numpy as np
 import threading
 import time
 import queue
@@ -7,15 +5,25 @@ import uuid
 import logging
 
 from dct.util.silverstone import DeepRacerCar
+from dct.util.ring import RingBuffer
+from dct.camera.mjpeg import MJPEGParser
+from dct.camera.frame import Frame
+from dct.camera.quality import QualityController, SourceSettings, quality_ladder
+from dct.util import metrics, tracing
 
 
 class StreamConsumer:
     def __init__(self):
         self.queue = queue.Queue()
+        self.dropped = 0  # Frames are never dropped, the queue is unbounded.
 
     def notify(self, frame):
         self.queue.put(frame)
 
+    def depth(self):
+        """Number of frames waiting to be read."""
+        return self.queue.qsize()
+
     def frame_iterator(self):
         try:
             while True:
@@ -30,22 +38,73 @@ class StreamConsumer:
             return
 
 
+class LatestFrameConsumer(StreamConsumer):
+    """Consumer with fixed memory use which always hands out the newest frame.
+
+    Frames are written into a ring buffer overwriting the oldest entries, so a slow
+    reader skips ahead instead of falling behind real time. Frames which are
+    overwritten or skipped before being read are counted as dropped.
+    """
+
+    def __init__(self, capacity=2):
+        self.ring = RingBuffer(capacity)
+        self.cursor = 0  # Sequence number of the next frame to read.
+
+        self.delivered = 0  # Frames handed out by frame_iterator.
+        self.dropped = 0  # Frames never handed out.
+        self.lag = 0.0  # Seconds between arrival and hand out of the last frame.
+        self.max_lag = 0.0
+
+    def notify(self, frame):
+        self.ring.append(frame)
+
+    def depth(self):
+        return self.ring.head - self.cursor
+
+    def frame_iterator(self):
+        while True:
+            # If no new frame for 1 second, stop iterating.
+            if not self.ring.wait(self.cursor, timeout=1):
+                return
+
+            sequence, frame = self.ring.latest()
+            self.dropped += sequence - self.cursor
+            self.cursor = sequence + 1
+
+            if frame is None:
+                return
+
+            self.delivered += 1
+            self.lag = time.time() - frame.timestamp
+            self.max_lag = max(self.max_lag, self.lag)
+
+            yield frame
+
+
 class BaseStream:
     """Base class which serves as a blueprint for frame providing objects."""
 
     def __init__(self):
         self.identifier = uuid.uuid4()
         self.consumers = []
+        self.name = str(self.identifier)  # Label of the stream in metrics.
 
         logging.info("Creating source stream {}".format(self.identifier))
 
     def publish_frame(self, frame):
+        if frame is not None and frame.trace is not None:
+            frame.trace.mark(tracing.PUBLISHED)
+
         for consumer in self.consumers:
             consumer.notify(frame)
 
     def subscribe(self, consumer: StreamConsumer):
         self.consumers.append(consumer)
 
+        labels = (self.name, len(self.consumers) - 1)
+        metrics.CONSUMER_DEPTH.labels(*labels).set_function(consumer.depth)
+        metrics.CONSUMER_DROPPED.labels(*labels).set_function(lambda: consumer.dropped)
+
     def unsubscribe(self, consumer: StreamConsumer):
         if consumer in self.consumers:
             self.consumers.remove(consumer)
@@ -64,8 +123,36 @@ class BaseStream:
 
 
 class DeepRacerMJPEGStream(BaseStream):
+    """Camera feed of a car.
+
+    The quality and resolution requested from the car adapt to the link: when the
+    framerate drops, frames arrive irregularly or the car starts queueing frames,
+    the feed is reconnected with cheaper settings, and with better settings again
+    once the link has recovered (see QualityController). Viewers keep receiving
+    frames while the settings change.
+
+    Args:
+        car (DeepRacerCar): Car to stream from.
+        width (int): Width of the feed.
+        height (int): Height of the feed.
+        quality (int): JPEG quality of the feed in range [1, 100].
+        min_fps (float): Minimum framerate of a healthy feed.
+        adaptive (bool): Lower the quality and resolution when the link degrades,
+            otherwise the feed is only reconnected at the same settings.
+        min_quality (int): Lowest JPEG quality used when adapting.
+        min_scale (float): Smallest fraction of the resolution used when adapting.
+    """
+
     def __init__(
-        self, car: DeepRacerCar, width=480, height=360, quality=90, min_fps=10.0
+        self,
+        car: DeepRacerCar,
+        width=480,
+        height=360,
+        quality=90,
+        min_fps=10.0,
+        adaptive=True,
+        min_quality=20,
+        min_scale=0.5,
     ):
         super().__init__()
 
@@ -73,23 +160,64 @@ class DeepRacerMJPEGStream(BaseStream):
         self.videoThread = threading.Thread(target=self.process_frames)
         self.videoThread.daemon = True
 
-        self.video_url = car.camera_feed(width=width, height=height, quality=quality)
-        self.video_width = width
-        self.video_height = height
-
         if quality <= 0 or quality > 100:
             raise ValueError("Video quality should be in range [1, 100]")
 
+        if adaptive:
+            ladder = quality_ladder(width, height, quality, min(min_quality, quality), min_scale)
+        else:
+            ladder = [SourceSettings(width, height, quality)]
+
         self.quality = quality  # Minimum quality of the video stream, lower will use less data at the cost of lower video quality.
         self.min_fps = min_fps  # Minimum FPS required for broadcasting, if approx fps too low the stream will disconnect.
-        self.framerate = None  # Stores current framerate approximation.
+        self.controller = QualityController(ladder, min_fps=min_fps)
+        self.sequence = 0  # Number of frames received from the car.
+        self.chunk_size = 64 * 1024  # Maximum number of bytes read from the response at once.
+        self.retry_delay = (0.5, 5.0)  # Delay before reconnecting a lost feed, doubled per failure.
+
+        self.name = car.name
+        self.ingest_frames = metrics.INGEST_FRAMES.labels(car.name)
+        self.ingest_bytes = metrics.INGEST_BYTES.labels(car.name)
+        self.ingest_reconnects = metrics.INGEST_RECONNECTS.labels(car.name)
+        metrics.INGEST_FPS.labels(car.name).set_function(lambda: self.framerate)
+        metrics.INGEST_LEVEL.labels(car.name).set_function(lambda: self.controller.level)
+
+    @property
+    def framerate(self):
+        """Framerate measured over the last second, None until measured."""
+        return self.controller.framerate
+
+    @property
+    def video_url(self):
+        return self.car.camera_feed(*self.controller.settings)
 
     def start(self):
         self.videoThread.start()
         logging.debug("Starting streaming thread for stream {}".format(self.identifier))
 
+    def read_frames(self, response):
+        """Yield every JPEG frame from a multipart MJPEG response as soon as it is complete.
+
+        Yields:
+            tuple: JPEG bytes, capture time sent by the car (None if not sent) and the
+                time the chunk which completed the frame was received.
+        """
+        parser = MJPEGParser()
+
+        for chunk in response.iter_content(chunk_size=self.chunk_size):
+            received = time.time()
+            frames = parser.feed(chunk)
+
+            for jpg, capture in zip(frames, parser.capture_times):
+                yield jpg, capture, received
+
     def process_frames(self):
+        retry_delay = self.retry_delay[0]
+
         while True:
+            response = None
+            settings = None  # Settings to reconnect with right away, None if the feed was lost.
+
             try:
                 logging.info(
                     "Attempting to connect to stream {}".format(self.identifier)
@@ -103,76 +231,84 @@ class DeepRacerMJPEGStream(BaseStream):
                     )
                     continue
 
-                bytebuffer = bytes()
-
                 response = self.car.session.get(self.video_url, stream=True, timeout=6)
                 response.raise_for_status()
 
-                chunk_size = 10 * 1024 * 1024
+                self.controller.connected()
+                current = self.controller.settings
 
-                start_frame = time.time()
-                framerate_counter = 0
+                for jpg, capture, received in self.read_frames(response):
+                    frame_time = time.time()
 
-                for chunk in response.iter_content(chunk_size=chunk_size):
-                    bytebuffer += chunk
-                    a = bytebuffer.find(b"\xff\xd8")
-                    b = bytebuffer.find(b"\xff\xd9")
+                    # Decoding is left to the consumers which actually render the frame.
+                    frame = Frame(
+                        jpg,
+                        frame_time,
+                        self.sequence,
+                        self.car.telemetry,
+                        capture=capture,
+                        trace=tracing.TRACER.start(capture, received, frame_time),
+                    )
+                    self.sequence += 1
 
-                    if a != -1 and b != -1:
-                        framerate_counter += 1
-                        frame_time = time.time()
+                    self.ingest_frames.inc()
+                    self.ingest_bytes.inc(len(jpg))
 
-                        jpg = bytebuffer[a : b + 2]
-                        bytebuffer = bytebuffer[b + 2 :]
-                        frame = cv2.imdecode(
-                            np.fromstring(jpg, dtype=np.uint8), cv2.IMREAD_COLOR
-                        )
+                    # Car will start "enqueing" frames if it cannot send them fast enough causing huge delays on the stream after a period of bad connection.
+                    # Monitor the feed and reconnect with settings the link can handle.
+                    settings = self.controller.observe(frame_time, capture)
+                    if self.controller.stable:
+                        retry_delay = self.retry_delay[0]
 
-                        # Car will start "enqueing" frames if it cannot send them fast enough causing huge delays on the stream after a period of bad connection.
-                        # Workaround: monitor framerate, if it drops try to reconnect.
-                        if (frame_time - start_frame) > 1:
-                            self.framerate = framerate_counter / (
-                                frame_time - start_frame
-                            )
+                    # If no approximate framerate yet, don't broadcast the frames to prevent lag when low framerate occurs.
+                    if self.framerate is not None:
+                        self.publish_frame(frame)
 
-                            framerate_counter = 0
-                            start_frame = frame_time
-                            logging.debug("FPS: {}".format(self.framerate))
-
-                        # If no approximate framerate yet, don't broadcast the frames to prevent lag when low framerate occurs.
-                        if self.framerate is None:
-                            continue
-                        elif self.framerate < self.min_fps:
-                            logging.debug(
-                                "Stopping because of low framerate: {}".format(
-                                    self.framerate
-                                )
+                    if settings is not None:
+                        logging.info(
+                            "Reconnecting stream {} at {}x{} quality {} (fps {:.1f}, jitter {:.3f}s)".format(
+                                self.identifier,
+                                settings.width,
+                                settings.height,
+                                settings.quality,
+                                self.controller.framerate,
+                                self.controller.jitter,
                             )
-                            self.framerate = None
-                            break
-
-                        self.publish_frame(frame)
+                        )
+                        break
             except Exception as e:
                 logging.debug(e)
                 pass
             finally:
-                retry_rate = 5
-                logging.debug(
-                    "Finish stream for {}, retry in {} seconds...".format(
-                        self.identifier, retry_rate
+                if response is not None:
+                    response.close()
+                    self.ingest_reconnects.inc()
+
+                if settings is not None and settings == current:
+                    # Reconnecting only drops the frames queued on the car, back off so
+                    # an overloaded car is not hammered with reconnects.
+                    time.sleep(retry_delay)
+                    retry_delay = min(retry_delay * 2, self.retry_delay[1])
+                elif settings is None:
+                    logging.debug(
+                        "Finish stream for {}, retry in {} seconds...".format(
+                            self.identifier, retry_delay
+                        )
                     )
-                )
 
-                # Notify no frame is sent.
-                self.publish_frame(None)
+                    # Notify no frame is sent.
+                    self.controller.disconnected()
+                    self.publish_frame(None)
 
-                # On failure try to reconnect to stream every 5 seconds.
-                time.sleep(retry_rate)
+                    # Back off while the car cannot be reached.
+                    time.sleep(retry_delay)
+                    retry_delay = min(retry_delay * 2, self.retry_delay[1])
 
     @property
     def width(self):
-        return self.video_width
+        # Current size of the feed, smaller than configured while quality is reduced.
+        return self.controller.settings.width
 
     @property
     def height(self):
-        return self.video_height
+        return self.controller.settings.height
@@ -5,16 +5,24 @@ import logging
 import sys
 import socket
 import os
+import time
 
 
 from dct.util.silverstone import DeepRacerCar
-from dct.camera.stream import DeepRacerMJPEGStream, StreamConsumer
+from dct.util.cache import ModelCache, DEFAULT_CACHE_PATH
+from dct.util.simulator import SimulatedCar, recorded_frames
+from dct.util.tracing import TRACER
+from dct.bench import suite
+from dct.camera.stream import DeepRacerMJPEGStream, LatestFrameConsumer
+from dct.camera.recorder import StreamRecorder, list_segments
+from dct.camera.replay import ReplayCar, ReplayStream
 from dct.visualizations.base import BaseFrameVisualizer
 from dct.visualizations.hud import HudOverlay
 from dct.visualizations.gradcam import GradCamOverlay
 
 from dct.stream.broadcaster import Broadcaster
 from dct.stream.http import HTTPRequestHandler
+from dct.stream.aio import AsyncHTTPRequestHandler
 
 requests.packages.urllib3.disable_warnings()
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
@@ -35,74 +43,196 @@ vizlog.addHandler(handler)
 root.addHandler(handler)
 
 
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "config.json")
+
+
 @click.group()
+@click.option(
+    "--config",
+    "config_path",
+    type=click.Path(dir_okay=False),
+    default=DEFAULT_CONFIG_PATH,
+    help="Config file, config.json in the repository by default.",
+)
 @click.pass_context
-def cli(ctx):
+def cli(ctx, config_path):
     ctx.ensure_object(dict)
 
-    # Add config to context
-    with open(
-        os.path.join(os.path.dirname(__file__), "..", "..", "config.json"), "r"
-    ) as f:
-        config = json.load(f)
+    # Add config to context, the simulator and benchmarks do not need one.
+    config = {}
+    if os.path.exists(config_path) or ctx.invoked_subcommand not in ("simulate", "bench"):
+        with open(config_path, "r") as f:
+            config = json.load(f)
 
     # Store in context so other commands can use.
     ctx.obj["CONFIG"] = config
 
 
+def request_handler(config, mode=None):
+    if (mode or config.get("server_mode", "threaded")) == "asyncio":
+        return AsyncHTTPRequestHandler(config["port"])
+
+    return HTTPRequestHandler(config["port"])
+
+
+def enable_tracing(path):
+    """Trace every frame, returns the callback which writes the summary to path on quit."""
+    TRACER.enable()
+    logging.info("Tracing frames, latency summary available at /trace")
+
+    def dump():
+        with open(path, "w") as f:
+            json.dump(TRACER.summary(), f, indent=2)
+
+        logging.info("Trace summary written to {}".format(path))
+
+    return dump
+
+
+TRACE_OPTION = click.option(
+    "--trace",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Trace the latency of every frame and write the summary as JSON to this file on quit.",
+)
+
+
+def serve(requestHandler, broadcasters, port, cleanup=()):
+    """Start the broadcasters and serve them until 'quit' is entered."""
+    for broadcaster in broadcasters:
+        broadcaster.start()
+        requestHandler.addBroadcaster(broadcaster, key=broadcaster.key)
+
+        logging.info("Output stream available: {}".format(broadcaster.key))
+
+    def quit():
+        for callback in cleanup:
+            callback()
+
+        # broadcaster.kill = True
+        requestHandler.kill = True
+        quitsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        quitsock.connect(("127.0.0.1", port))
+        quitsock.close()
+        sys.exit(1)
+
+    try:
+        while input() != "quit":
+            continue
+        quit()
+    except KeyboardInterrupt:
+        quit()
+    except EOFError:
+        try:
+            quit()
+        except KeyboardInterrupt:
+            os._exit(0)
+
+
 @cli.command()
+@click.option(
+    "--mode",
+    type=click.Choice(["threaded", "asyncio"]),
+    default=None,
+    help="Serve clients with a thread per client or from a single asyncio event loop.",
+)
+@click.option(
+    "--record",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Record the original camera frames of every car into this directory.",
+)
+@TRACE_OPTION
 @click.pass_context
-def server(ctx):
+def server(ctx, mode, record, trace):
     config = ctx.obj["CONFIG"]
+    record = record or config.get("record")
+    cleanup = [enable_tracing(trace)] if trace is not None else []
 
     # Start the broadcasting server.
-    requestHandler = HTTPRequestHandler(config["port"])
+    requestHandler = request_handler(config, mode)
     requestHandler.start()
 
+    cache_config = config.get("model_cache", {})
+    model_cache = ModelCache(
+        path=cache_config.get("path", DEFAULT_CACHE_PATH),
+        max_size=cache_config.get("max_size_mb", 2048) * 1024 * 1024,
+        # At least the current model of every car stays parsed.
+        graphs=max(cache_config.get("graphs", 4), len(config["cars"])),
+    )
+
     cars = []
     for car in config["cars"]:
         car = DeepRacerCar(
-            car["ip"], ssh_password=car["ssh_password"], name=car["name"]
+            car["ip"],
+            ssh_password=car.get("ssh_password"),
+            name=car["name"],
+            model_config=config.get("tensorflow"),
+            model_cache=model_cache,
+            telemetry_capacity=config.get("telemetry_capacity", 65536),
+            scheme=car.get("scheme", "https"),
+            log_port=car.get("log_port"),
         )
         car.connect()
         cars.append(car)
 
+    session = time.strftime("%Y%m%d-%H%M%S")
+    recorders = []
+
+    adaptive_config = config.get("adaptive_quality", {})
+
     broadcasters = []
     for i, car in enumerate(cars):
+        requestHandler.addTelemetry(car.telemetry, key=str(i))
+
         stream = DeepRacerMJPEGStream(
             car,
             quality=config["stream_quality"],
             width=config["stream_width"],
             height=config["stream_height"],
+            min_fps=adaptive_config.get("min_fps", 10.0),
+            adaptive=adaptive_config.get("enabled", True),
+            min_quality=adaptive_config.get("min_quality", 20),
+            min_scale=adaptive_config.get("min_scale", 0.5),
         )
         stream.start()
 
-        # TODO: Hacky.
-        streamconsumer = StreamConsumer()
-        stream.consumers.append(streamconsumer)
+        if record is not None:
+            recorder = StreamRecorder(os.path.join(record, session, str(i)))
+            recorder.start()
+            stream.subscribe(recorder)
+            recorders.append(recorder)
+
+        streamconsumer = LatestFrameConsumer()
+        stream.subscribe(streamconsumer)
         viz = BaseFrameVisualizer(
             streamconsumer,
             width=config["stream_width"],
             height=config["stream_height"],
+            name="{}/live".format(i),
         )
 
-        streamconsumer2 = StreamConsumer()
-        stream.consumers.append(streamconsumer2)
+        streamconsumer2 = LatestFrameConsumer()
+        stream.subscribe(streamconsumer2)
         viz2 = BaseFrameVisualizer(
             streamconsumer2,
             width=config["stream_width"],
             height=config["stream_height"],
+            name="{}/live_hud".format(i),
         )
         viz2.add(HudOverlay(car))
 
-        streamconsumer3 = StreamConsumer()
-        stream.consumers.append(streamconsumer3)
+        streamconsumer3 = LatestFrameConsumer()
+        stream.subscribe(streamconsumer3)
         viz3 = BaseFrameVisualizer(
-            streamconsumer,
+            streamconsumer3,
             width=config["stream_width"],
             height=config["stream_height"],
+            name="{}/live_grad".format(i),
         )
-        viz3.add(GradCamOverlay(car))
+        # Models of simulated cars cannot be downloaded.
+        if not car.simulated:
+            viz3.add(GradCamOverlay(car, rate=config.get("gradcam_rate", 5.0)))
         viz3.add(HudOverlay(car))
 
         # Add the broadcasters
@@ -110,28 +240,137 @@ def server(ctx):
         broadcasters.append(Broadcaster(viz2, key="{}/live_hud".format(i)))
         broadcasters.append(Broadcaster(viz3, key="{}/live_grad".format(i)))
 
-    for broadcaster in broadcasters:
-        broadcaster.start()
-        requestHandler.addBroadcaster(broadcaster, key=broadcaster.key)
+    serve(requestHandler, broadcasters, config["port"], cleanup=[r.close for r in recorders] + cleanup)
 
-        logging.info("Output stream available: {}".format(broadcaster.key))
 
-    def quit():
-        # broadcaster.kill = True
-        requestHandler.kill = True
-        quitsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        quitsock.connect(("127.0.0.1", config["port"]))
-        quitsock.close()
-        sys.exit(1)
+@cli.command()
+@click.argument("recording", type=click.Path(exists=True, file_okay=False))
+@click.option(
+    "--speed",
+    type=float,
+    default=1.0,
+    help="Playback speed, 1 is real time, 0 replays as fast as possible.",
+)
+@click.option("--loop", is_flag=True, help="Start over at the end of the recording.")
+@click.option(
+    "--mode",
+    type=click.Choice(["threaded", "asyncio"]),
+    default=None,
+    help="Serve clients with a thread per client or from a single asyncio event loop.",
+)
+@TRACE_OPTION
+@click.pass_context
+def replay(ctx, recording, speed, loop, mode, trace):
+    """Serve a recording made with 'server --record' without cars."""
+    config = ctx.obj["CONFIG"]
+    cleanup = [enable_tracing(trace)] if trace is not None else []
+
+    # A session directory holds a recording per car, or a single car recording is given.
+    if list_segments(recording):
+        directories = [recording]
+    else:
+        directories = sorted(
+            os.path.join(recording, name)
+            for name in os.listdir(recording)
+            if os.path.isdir(os.path.join(recording, name))
+        )
+
+    requestHandler = request_handler(config, mode)
+    requestHandler.start()
+
+    broadcasters = []
+    for i, directory in enumerate(directories):
+        stream = ReplayStream(directory, speed=speed, loop=loop)
+        car = ReplayCar(name=os.path.basename(os.path.normpath(directory)))
+
+        streamconsumer = LatestFrameConsumer()
+        stream.subscribe(streamconsumer)
+        viz = BaseFrameVisualizer(
+            streamconsumer, width=stream.width, height=stream.height, name="{}/live".format(i)
+        )
+
+        streamconsumer2 = LatestFrameConsumer()
+        stream.subscribe(streamconsumer2)
+        viz2 = BaseFrameVisualizer(
+            streamconsumer2, width=stream.width, height=stream.height, name="{}/live_hud".format(i)
+        )
+        viz2.add(HudOverlay(car))
+
+        stream.start()
+
+        broadcasters.append(Broadcaster(viz, key="{}/live".format(i)))
+        broadcasters.append(Broadcaster(viz2, key="{}/live_hud".format(i)))
+
+    serve(requestHandler, broadcasters, config["port"], cleanup=cleanup)
+
+
+@cli.command()
+@click.option("--cars", type=int, default=4, help="Number of simulated cars.")
+@click.option("--fps", type=float, default=15.0, help="Camera frames per second.")
+@click.option(
+    "--recording",
+    type=click.Path(exists=True, file_okay=False),
+    default=None,
+    help="Stream frames of a single car recording instead of synthetic frames.",
+)
+@click.option("--port", type=int, default=9000, help="First port, each car uses two.")
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write a config for 'dct --config <OUTPUT> server' with the simulated cars.",
+)
+@click.pass_context
+def simulate(ctx, cars, fps, recording, port, output):
+    """Run local stand-ins for DeepRacer cars to load test the server."""
+    config = dict(ctx.obj["CONFIG"])
+
+    source = recorded_frames(recording) if recording is not None else None
+
+    simulated = []
+    for i in range(cars):
+        car = SimulatedCar(
+            "Simulated {}".format(i + 1),
+            port + 2 * i,
+            port + 2 * i + 1,
+            fps=fps,
+            source=source,
+        )
+        car.start()
+        simulated.append(car)
+
+    config["cars"] = [car.config() for car in simulated]
+    config.setdefault("stream_width", 480)
+    config.setdefault("stream_height", 360)
+    config.setdefault("stream_quality", 50)
+    config.setdefault("port", 8080)
+
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(config, f, indent=2)
+
+        logging.info("Config written to {}".format(output))
 
     try:
-        while input() != "quit":
-            continue
-        quit()
-    except KeyboardInterrupt:
-        quit()
-    except EOFError:
         try:
-            quit()
-        except KeyboardInterrupt:
-            os._exit(0)
+            while input() != "quit":
+                continue
+        except EOFError:
+            # Without a terminal run until interrupted.
+            while True:
+                time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for car in simulated:
+            car.stop()
+
+
+@cli.command(
+    context_settings={"ignore_unknown_options": True, "allow_extra_args": True},
+    add_help_option=False,
+)
+@click.argument("args", nargs=-1, type=click.UNPROCESSED)
+def bench(args):
+    """Run the pipeline benchmark suite, see 'dct bench --help'."""
+    suite.main(list(args))
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+
+from dct.util.tracing import TRACER
+from .http import STREAM_HEADER, route_response
+
+try:
+    all_tasks = asyncio.all_tasks
+except AttributeError:  # Python 3.6
+    all_tasks = asyncio.Task.all_tasks
+
+
+class AsyncStreamingClient:
+    """Viewer served by the asyncio server, registered with the broadcaster so it
+    counts as a client and receives the kill signal."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.frames = None
+        self.cursor = 0
+        self.skipped = 0
+        self.bytesCounter = None
+        self.key = None
+        self.connected = True
+        self.kill = False
+
+    def attach(self, frames):
+        self.frames = frames
+        self.cursor = max(0, frames.head - 1)
+
+
+class AsyncHTTPRequestHandler:
+    """Serves the broadcaster streams to all clients from a single asyncio event loop.
+
+    Drop-in alternative for HTTPRequestHandler: uses the same addBroadcaster keys and
+    /stream/<key> responses, but without a thread per connection. Writes never block
+    the loop, each client has a write buffer limit and skips to the newest frame
+    once the buffer has drained instead of queueing frames.
+    """
+
+    def __init__(self, port, write_buffer_limit=256 * 1024, write_timeout=10):
+        self.port = port
+        self.header = STREAM_HEADER
+        self.writeBufferLimit = write_buffer_limit
+        self.writeTimeout = write_timeout
+
+        self.broadcasters = {}
+        self.telemetry = {}
+        self.frameEvents = {}
+        self.kill = False
+
+        self.loop = asyncio.new_event_loop()
+        self.server = None
+        self.ready = threading.Event()  # Set once listening, port then holds the bound port.
+
+        self.clientThread = threading.Thread(target=self.serve)
+        self.clientThread.daemon = True
+
+    def addBroadcaster(self, broadcaster, key):
+        if key in self.broadcasters:
+            raise ValueError("Broadcaster with key exists.")
+
+        self.broadcasters[key] = broadcaster
+        broadcaster.listeners.append(lambda: self.notify(key))
+
+    def addTelemetry(self, telemetry, key):
+        if key in self.telemetry:
+            raise ValueError("Telemetry with key exists.")
+
+        self.telemetry[key] = telemetry
+
+    def start(self):
+        self.clientThread.start()
+
+    def serve(self):
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.handleRequest, "0.0.0.0", self.port)
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.ready.set()
+        self.loop.run_forever()
+
+        # Stopped, close the listening socket and the open connections before the loop.
+        self.server.close()
+        tasks = [task for task in all_tasks(self.loop) if not task.done()]
+        for task in tasks:
+            task.cancel()
+
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.run_until_complete(self.server.wait_closed())
+        self.loop.close()
+
+    def stop(self):
+        self.kill = True
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def notify(self, key):
+        # Called from the broadcaster thread.
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.wake, key)
+
+    def wake(self, key):
+        event = self.frameEvents.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def frameEvent(self, key):
+        if key not in self.frameEvents:
+            self.frameEvents[key] = asyncio.Event()
+
+        return self.frameEvents[key]
+
+    async def handleRequest(self, reader, writer):
+        try:
+            try:
+                request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5)
+                match = re.search("GET (.*) ", request.decode("utf-8"))
+                requestPath = match.group(1)
+            except Exception as e:
+                logging.debug(e)
+                return
+
+            # Telemetry queries copy at most the capacity of a series, fast enough to run on the loop.
+            response = route_response(requestPath, self.telemetry)
+            if response is not None:
+                writer.write(response)
+                await writer.drain()
+                return
+
+            if "/stream/" in requestPath:
+                key = requestPath.split("/stream/")[1]
+
+                if key in self.broadcasters:
+                    broadcaster = self.broadcasters[key]
+                    if broadcaster.broadcasting:
+                        await self.serveStream(key, broadcaster, writer)
+
+                    return
+
+            writer.write(b"HTTP/1.0 302 FOUND")
+            await writer.drain()
+        except (ConnectionError, asyncio.CancelledError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    async def serveStream(self, key, broadcaster, writer):
+        transport = writer.transport
+        transport.set_write_buffer_limits(high=self.writeBufferLimit)
+
+        writer.write(
+            self.header.format(boundaryKey=broadcaster.boundarySeparator).encode()
+        )
+
+        client = AsyncStreamingClient(writer)
+        broadcaster.addClient(client)
+        frames = client.frames
+
+        try:
+            while not client.kill and not transport.is_closing():
+                if frames.head <= client.cursor:
+                    await self.frameEvent(key).wait()
+                    continue
+
+                # Always continue with the newest frame, frames are complete parts.
+                if frames.head - client.cursor > 1:
+                    client.skipped += frames.head - 1 - client.cursor
+                    client.cursor = frames.head - 1
+
+                try:
+                    data = frames.get(client.cursor)
+                except IndexError:
+                    continue
+
+                client.cursor += 1
+                handed = time.time()
+                for buffer in data.buffers:
+                    writer.write(buffer)
+
+                if client.bytesCounter is not None:
+                    client.bytesCounter.inc(data.size)
+
+                # Only waits when this client's buffer is above its limit, drop stalled clients.
+                await asyncio.wait_for(writer.drain(), self.writeTimeout)
+
+                # Sent means accepted by the transport, which buffers up to writeBufferLimit.
+                if data.trace is not None:
+                    TRACER.record(key, data.trace, handed, time.time())
+        finally:
+            client.connected = False
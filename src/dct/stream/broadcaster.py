@@ -1,14 +1,50 @@
 import threading
 import time
 
+from dct.util import metrics, tracing
+from dct.util.ring import RingBuffer
+
+
+class PreparedFrame:
+    """Multipart part kept as separate buffers, so the JPEG payload is sent as is
+    instead of being copied into a single bytes object."""
+
+    __slots__ = ("buffers", "size", "trace")
+
+    def __init__(self, *buffers, trace=None):
+        self.buffers = tuple(memoryview(buffer) for buffer in buffers)
+        self.size = sum(buffer.nbytes for buffer in self.buffers)
+        self.trace = trace  # FrameTrace of the source frame up to prepared, if traced.
+
+    def __len__(self):
+        return self.size
+
+    def views(self, offset=0):
+        """Buffers that remain to be sent after offset bytes have been sent."""
+        if offset == 0:
+            return self.buffers
+
+        for i, buffer in enumerate(self.buffers):
+            if offset < buffer.nbytes:
+                return (buffer[offset:],) + self.buffers[i + 1 :]
+
+            offset -= buffer.nbytes
+
+        return ()
+
 
 class Broadcaster:
     """Handles relaying the source MJPEG stream to connected clients"""
 
-    def __init__(self, source, key="/"):
+    def __init__(self, source, key="/", ring_size=8):
         self.source = source
         self.key = key
         self.clients = []
+        self.clientsLock = threading.Lock()  # Clients are added from the server thread.
+
+        # Prepared frames shared by all clients, each client keeps its own read cursor.
+        self.frames = RingBuffer(ring_size)
+        self.listeners = []  # Callables notified after a frame is added to the ring.
 
         self.kill = False
         self.broadcastThread = threading.Thread(target=self.streamFromSource)
@@ -17,44 +53,82 @@ class Broadcaster:
         self.broadcasting = False
         self.boundarySeparator = "frame"
 
+        self.framesCounter = metrics.BROADCASTER_FRAMES.labels(key)
+        self.bytesCounter = metrics.BROADCASTER_BYTES.labels(key)
+        metrics.BROADCASTER_CLIENTS.labels(key).set_function(lambda: len(self.clients))
+
+        # Part header template, only the length and timestamp differ per frame.
+        self.partHeader = (
+            "--{}\r\n"
+            "Content-type: image/jpeg\r\n"
+            "Content-length: %d\r\n"
+            "X-Timestamp: %.6f\r\n"
+        ).format(self.boundarySeparator).encode()
+
     def start(self):
         self.broadcasting = True
         self.broadcastThread.start()
 
+    def idle(self):
+        # A frame is still rendered once the broadcaster is killed, so the loop stops.
+        return len(self.clients) == 0 and not self.kill
+
+    def addClient(self, client):
+        client.attach(self.frames)
+        client.key = self.key
+        client.bytesCounter = self.bytesCounter
+
+        with self.clientsLock:
+            self.clients.append(client)
+
     def broadcast(self, data):
-        # Serve to clients.
-        for client in self.clients:
-            if not client.connected:
-                self.clients.remove(client)
+        # Drop disconnected clients, connected ones pick the frame up from the ring.
+        with self.clientsLock:
+            self.clients[:] = [client for client in self.clients if client.connected]
+
+        self.frames.append(data)
+        self.framesCounter.inc()
+
+        for listener in self.listeners:
+            listener()
 
-            client.bufferStreamData(data)
+    def prepare_frame(self, data, frame=None, trace=None):
+        """Multipart part for a JPEG.
 
-    def prepare_frame(self, frame):
-        data = "--{}".format(self.boundarySeparator).encode()
-        data += b"\r\n"
-        data += b"Content-type: image/jpeg\r\n"
-        data += "Content-length: {}\r\n".format(len(frame)).encode()
-        data += "X-Timestamp: {:6f}\r\n\r\n".format(time.time()).encode()
-        data += frame
-        data += b"\r\n"
+        Args:
+            data (bytes): JPEG to send.
+            frame (Frame, optional): Source frame, its capture time (or arrival time if
+                the car did not send one), sequence number and aligned throttle are sent
+                as headers. Placeholders are stamped with the current time.
+            trace (FrameTrace, optional): Trace of the frame, marked as prepared.
+        """
+        if frame is None:
+            return PreparedFrame(self.partHeader % (len(data), time.time()) + b"\r\n", data, b"\r\n")
 
-        return data
+        timestamp = frame.capture if frame.capture is not None else frame.timestamp
+        header = self.partHeader % (len(data), timestamp) + b"X-Sequence: %d\r\n" % frame.sequence
+
+        telemetry = frame.telemetry
+        if telemetry is not None and telemetry.throttle is not None:
+            header += b"X-Throttle: %.1f\r\n" % telemetry.throttle
+
+        if trace is not None:
+            trace.mark(tracing.PREPARED)
+
+        return PreparedFrame(header + b"\r\n", data, b"\r\n", trace=trace)
 
     def streamFromSource(self):
-        while True:
+        while not self.kill:
             self.broadcast(self.prepare_frame(self.source.placeholder()))
 
             try:
-                for data in self.source.generate_frames():
-                    if self.kill:
-                        for client in self.clients:
-                            client.kill = True
-                        return
-
-                    if data is None:
+                for data, frame in self.source.generate_frames(skip=self.idle):
+                    if self.kill or data is None:
                         break
 
-                    self.broadcast(self.prepare_frame(data))
+                    # Visualizers expose the trace of the frame they just yielded.
+                    trace = getattr(self.source, "trace", None)
+                    self.broadcast(self.prepare_frame(data, frame, trace))
             except Exception as e:
                 print(e)
             finally:
@@ -62,3 +136,7 @@ class Broadcaster:
 
                 # Retry every second.
                 time.sleep(1)
+
+        with self.clientsLock:
+            for client in self.clients:
+                client.kill = True
@@ -2,27 +2,115 @@ import socket
 import threading
 import logging
 import re
+import json
+import urllib.parse
 from .streaming import TCPStreamingClient
 from .broadcaster import Broadcaster
+from dct.util.metrics import REGISTRY
+from dct.util.tracing import TRACER
 import os
 
 
+STREAM_HEADER = (
+    "HTTP/1.0 200 OK\r\n"
+    "Connection: keep-alive\r\n"
+    "Server: MJPEG-DeepRacer\r\n"
+    "Cache-Control: no-store, no-cache, must-revalidate\r\n"
+    "Cache-Control: pre-check=0, post-check=0, max-age=0\r\n"
+    "Pragma: no-cache\r\n"
+    "Expires: -1\r\n"
+    "Content-Type: multipart/x-mixed-replace;boundary={boundaryKey}\r\n"
+    "\r\n"
+)
+
+JSON_HEADER = (
+    "HTTP/1.0 200 OK\r\n"
+    "Server: MJPEG-DeepRacer\r\n"
+    "Cache-Control: no-store\r\n"
+    "Access-Control-Allow-Origin: *\r\n"
+    "Content-Type: application/json\r\n"
+    "Content-Length: {length}\r\n"
+    "\r\n"
+)
+
+
+def metrics_response():
+    """Response for /metrics requests in the Prometheus text format."""
+    body = REGISTRY.expose().encode()
+    header = (
+        "HTTP/1.0 200 OK\r\n"
+        "Content-Type: text/plain; version=0.0.4\r\n"
+        "Content-Length: {}\r\n"
+        "\r\n".format(len(body))
+    )
+
+    return header.encode() + body
+
+
+def trace_response():
+    """Response for /trace requests, the latency percentiles of traced frames as JSON."""
+    body = json.dumps(TRACER.summary()).encode()
+
+    return JSON_HEADER.format(length=len(body)).encode() + body
+
+
+def telemetry_response(telemetry, requestPath):
+    """Response for /telemetry/<key>?start=<time>&end=<time>&points=<n> requests.
+
+    Args:
+        telemetry (dict): TelemetrySeries by key.
+        requestPath (str): Requested path, including the query string.
+
+    Returns:
+        bytes: The HTTP response, None if there is no series for the key.
+    """
+    url = urllib.parse.urlsplit(requestPath)
+    key = url.path.split("/telemetry/")[1]
+    if key not in telemetry:
+        return None
+
+    query = urllib.parse.parse_qs(url.query)
+    try:
+        start = float(query["start"][0]) if "start" in query else None
+        end = float(query["end"][0]) if "end" in query else None
+        points = int(query["points"][0]) if "points" in query else 500
+    except ValueError:
+        return b"HTTP/1.0 400 BAD REQUEST\r\n\r\n"
+
+    body = json.dumps(telemetry[key].query(start, end, max(1, points))).encode()
+
+    return JSON_HEADER.format(length=len(body)).encode() + body
+
+
+def route_response(requestPath, telemetry):
+    """Response for the /metrics, /trace and /telemetry/<key> endpoints.
+
+    Args:
+        requestPath (str): Requested path, including the query string.
+        telemetry (dict): TelemetrySeries by key.
+
+    Returns:
+        bytes: The HTTP response, None if the path is not one of these endpoints.
+    """
+    path = requestPath.split("?")[0]
+
+    if path == "/metrics":
+        return metrics_response()
+
+    if path == "/trace":
+        return trace_response()
+
+    if "/telemetry/" in requestPath:
+        return telemetry_response(telemetry, requestPath)
+
+    return None
+
+
 class HTTPRequestHandler:
     """Handles the initial connection with HTTP clients"""
 
     def __init__(self, port):
-        self.header = ""
-        self.header += "HTTP/1.0 200 OK\r\n"
-        self.header += "Connection: keep-alive\r\n"
-        self.header += "Server: MJPEG-DeepRacer\r\n"
-        self.header += "Cache-Control: no-store, no-cache, must-revalidate\r\n"
-        self.header += "Cache-Control: pre-check=0, post-check=0, max-age=0\r\n"
-        self.header += "Pragma: no-cache\r\n"
-        self.header += "Expires: -1\r\n"
-        self.header += (
-            "Content-Type: multipart/x-mixed-replace;boundary={boundaryKey}\r\n"
-        )
-        self.header += "\r\n"
+        self.header = STREAM_HEADER
 
         self.acceptsock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.acceptsock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -30,6 +118,7 @@ class HTTPRequestHandler:
         self.acceptsock.listen(10)
 
         self.broadcasters = {}
+        self.telemetry = {}
         self.kill = False
 
         self.clientThread = threading.Thread(target=self.acceptClients)
@@ -41,6 +130,12 @@ class HTTPRequestHandler:
 
         self.broadcasters[key] = broadcaster
 
+    def addTelemetry(self, telemetry, key):
+        if key in self.telemetry:
+            raise ValueError("Telemetry with key exists.")
+
+        self.telemetry[key] = telemetry
+
     def start(self):
         self.clientThread.start()
 
@@ -88,6 +183,15 @@ class HTTPRequestHandler:
                 print(e)
                 return
 
+            try:
+                response = route_response(requestPath, self.telemetry)
+                if response is not None:
+                    clientsock.sendall(response)
+                    clientsock.close()
+                    return
+            except Exception as e:
+                print(e)
+
             if "/stream/" in requestPath:
                 try:
                     key = requestPath.split("/stream/")[1]
@@ -101,8 +205,8 @@ class HTTPRequestHandler:
                                 ).encode()
                             )
                             client = TCPStreamingClient(clientsock)
+                            broadcaster.addClient(client)
                             client.start()
-                            broadcaster.clients.append(client)
                         else:
                             clientsock.close()
 
@@ -1,11 +1,19 @@
-from queue import Queue
+import socket
 import threading
+import time
+
+from dct.util.tracing import TRACER
 
 
 class StreamingClient(object):
     def __init__(self):
-        self.streamBuffer = bytes()
-        self.streamQueue = Queue()
+        self.frames = None  # Ring buffer of prepared frames shared with the broadcaster.
+        self.cursor = 0  # Sequence number of the next frame to send.
+        self.maxLag = 1  # Frames a client may fall behind before skipping to the newest.
+        self.skipped = 0
+        self.bytesCounter = None  # Metric of the broadcaster for bytes sent.
+        self.key = None  # Key of the broadcaster, traces are recorded under it.
+
         self.streamThread = threading.Thread(target=self.stream)
         self.streamThread.daemon = True
         self.connected = True
@@ -13,35 +21,72 @@ class StreamingClient(object):
 
         super().__init__()
 
+    def attach(self, frames):
+        self.frames = frames
+        # Start with the newest frame so the viewer does not wait for the next one.
+        self.cursor = max(0, frames.head - 1)
+
     def start(self):
         self.streamThread.start()
 
-    def transmit(self, data):
-        return len(data)
+    def transmit(self, buffers):
+        """Send buffers, returns the number of bytes sent."""
+        return sum(buffer.nbytes for buffer in buffers)
 
     def stop(self):
         pass
 
-    def bufferStreamData(self, data):
-        # use a thread-safe queue to ensure stream buffer is not modified while we're sending it
-        self.streamQueue.put(data)
+    def nextFrame(self):
+        """Next frame to send, skipping to the newest frame if the client fell behind.
+
+        Every ring entry is a complete multipart part, so skipping always lands on a
+        frame boundary.
+        """
+        head = self.frames.head
+        if head - self.cursor > self.maxLag or self.cursor < self.frames.tail:
+            self.skipped += head - 1 - self.cursor
+            self.cursor = head - 1
+
+        try:
+            data = self.frames.get(self.cursor)
+        except IndexError:
+            # Overwritten in the meantime, retry with the newest frame.
+            self.cursor = self.frames.head - 1
+            data = self.frames.get(self.cursor)
+
+        self.cursor += 1
+        return data
 
     def stream(self):
         while self.connected:
-            # this call blocks if there's no data in the queue, avoiding the need for busy-waiting
-            self.streamBuffer += self.streamQueue.get()
+            # Blocks until the broadcaster adds a frame, wake up regularly to check for kill.
+            available = self.frames.wait(self.cursor, timeout=1)
 
             # check if kill or connected state has changed after being blocked
             if self.kill or not self.connected:
                 self.stop()
                 return
 
-            while len(self.streamBuffer) > 0:
-                streamedTo = self.transmit(self.streamBuffer)
+            if not available:
+                continue
+
+            frame = self.nextFrame()
+            handed = time.time()
+
+            # Track partial writes by offset, the frame buffers are never copied.
+            offset = 0
+            while offset < len(frame):
+                streamedTo = self.transmit(frame.views(offset))
                 if streamedTo and streamedTo >= 0:
-                    self.streamBuffer = self.streamBuffer[streamedTo:]
+                    offset += streamedTo
                 else:
-                    self.streamBuffer = bytes()
+                    break
+
+            if self.bytesCounter is not None:
+                self.bytesCounter.inc(offset)
+
+            if frame.trace is not None and offset == len(frame):
+                TRACER.record(self.key, frame.trace, handed, time.time())
 
 
 class TCPStreamingClient(StreamingClient):
@@ -53,9 +98,13 @@ class TCPStreamingClient(StreamingClient):
     def stop(self):
         self.sock.close()
 
-    def transmit(self, data):
+    def transmit(self, buffers):
         try:
-            return self.sock.send(data)
+            if hasattr(socket.socket, "sendmsg"):
+                # Scatter-gather write of header and payload in one system call.
+                return self.sock.sendmsg(buffers)
+
+            return self.sock.send(buffers[0])
         except OSError as e:
             self.connected = False
             self.sock.close()
@@ -0,0 +1,217 @@
+import collections
+import json
+import logging
+import os
+import shlex
+import shutil
+import tempfile
+import threading
+
+from dct.util.model import Model, ModelMetadata, model_digest
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "dct", "models")
+
+MODEL_FILE = "model.pb"
+METADATA_FILE = "model_metadata.json"
+
+
+class GraphCache:
+    """In-memory LRU cache of parsed models by content hash.
+
+    Evicted models are closed right away when no GradCamService uses them,
+    otherwise once the last service using them stops.
+    """
+
+    def __init__(self, capacity=4):
+        self.capacity = capacity
+        self.models = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, digest):
+        with self.lock:
+            return digest in self.models
+
+    def get(self, digest, load):
+        """Get a parsed model, calling load() to parse it if it is not cached."""
+        with self.lock:
+            if digest in self.models:
+                self.models.move_to_end(digest)
+                return self.models[digest]
+
+        model = load()
+
+        evicted = []
+        with self.lock:
+            if digest in self.models:
+                # Parsed concurrently, keep the model others may already use.
+                evicted.append(model)
+                model = self.models[digest]
+            else:
+                self.models[digest] = model
+
+            self.models.move_to_end(digest)
+
+            while len(self.models) > self.capacity:
+                evicted.append(self.models.popitem(last=False)[1])
+
+        for old in evicted:
+            old.evict()
+
+        return model
+
+
+class ModelCache:
+    """Persistent on-disk cache of model artifacts shared by all cars.
+
+    Artifacts are stored by the SHA-1 of their model.pb, so the same model on
+    multiple cars is only downloaded and stored once and survives restarts. Before
+    transferring anything the remote file is identified by a stat, and a checksum
+    computed on the car when the stat was not seen before. The least recently
+    used models are evicted once the cache exceeds max_size bytes.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_size=2 * 1024 ** 3, graphs=4):
+        self.path = os.path.expanduser(path)
+        self.max_size = max_size
+        self.graphs = GraphCache(graphs)
+        self.cars = 0  # Cars sharing the cache, each prefetches its share of the graphs.
+
+        self.lock = threading.Lock()
+
+        # Remote stat (host, path, size, mtime) to digest, avoids repeated checksums.
+        self.index_path = os.path.join(self.path, "index.json")
+        try:
+            with open(self.index_path, "r") as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+
+    def entry(self, digest):
+        return os.path.join(self.path, digest)
+
+    def paths(self, digest):
+        """Local paths of model.pb and model_metadata.json of a cached model."""
+        return (
+            os.path.join(self.entry(digest), MODEL_FILE),
+            os.path.join(self.entry(digest), METADATA_FILE),
+        )
+
+    def contains(self, digest):
+        return all(os.path.exists(path) for path in self.paths(digest))
+
+    def touch(self, digest):
+        # Directory modification time serves as last use time for eviction.
+        os.utime(self.entry(digest))
+
+    def remote_digest(self, sftp, host, remote_path):
+        """Identify a remote model.pb without transferring it.
+
+        Returns:
+            str: SHA-1 hex digest, None if it could not be determined remotely.
+        """
+        stat = sftp.stat(remote_path)
+        key = "{}:{}:{}:{}".format(host, remote_path, stat.st_size, stat.st_mtime)
+
+        if key not in self.index:
+            try:
+                output = sftp.execute("sha1sum {}".format(shlex.quote(remote_path)))
+                digest = output[0].decode().split()[0]
+            except Exception as e:
+                logging.debug("Remote checksum failed: {}".format(e))
+                return None
+
+            if len(digest) != 40:
+                return None
+
+            with self.lock:
+                self.index[key] = digest
+                with open(self.index_path, "w") as f:
+                    json.dump(self.index, f)
+
+        return self.index[key]
+
+    def fetch(self, sftp, host, remote_dir):
+        """Get the artifacts of a model on a car, downloading only if not cached.
+
+        Args:
+            sftp (pysftp.Connection): Connection to the car.
+            host (str): Car address, part of the remote file identity.
+            remote_dir (str): Directory with model.pb and model_metadata.json on the car.
+
+        Returns:
+            str: Digest of the model.
+        """
+        # The cache directory is only created once something is downloaded.
+        os.makedirs(self.path, exist_ok=True)
+
+        remote_model = "{}/{}".format(remote_dir, MODEL_FILE)
+        digest = self.remote_digest(sftp, host, remote_model)
+
+        if digest is not None and self.contains(digest):
+            self.touch(digest)
+            return digest
+
+        download = tempfile.mkdtemp(dir=self.path, prefix=".download-")
+        try:
+            model_path = os.path.join(download, MODEL_FILE)
+            sftp.get(remote_model, model_path)
+            sftp.get("{}/{}".format(remote_dir, METADATA_FILE), os.path.join(download, METADATA_FILE))
+
+            local_digest = model_digest(model_path)
+            if digest is not None and digest != local_digest:
+                raise Exception("Checksum mismatch for {}".format(remote_model))
+
+            with self.lock:
+                if not self.contains(local_digest):
+                    shutil.rmtree(self.entry(local_digest), ignore_errors=True)
+                    os.rename(download, self.entry(local_digest))
+        finally:
+            shutil.rmtree(download, ignore_errors=True)
+
+        self.touch(local_digest)
+        self.evict(keep=local_digest)
+
+        return local_digest
+
+    def size(self, digest):
+        return sum(os.path.getsize(path) for path in self.paths(digest) if os.path.exists(path))
+
+    def evict(self, keep=None):
+        """Remove least recently used models until the cache fits in max_size."""
+        with self.lock:
+            entries = [
+                name
+                for name in os.listdir(self.path)
+                if not name.startswith(".") and os.path.isdir(self.entry(name))
+            ]
+            entries.sort(key=lambda name: os.path.getmtime(self.entry(name)))
+
+            total = sum(self.size(name) for name in entries)
+            for name in entries:
+                if total <= self.max_size:
+                    break
+
+                if name == keep:
+                    continue
+
+                total -= self.size(name)
+                shutil.rmtree(self.entry(name), ignore_errors=True)
+                logging.info("Evicted model {} from cache".format(name))
+
+    def load(self, digest, config=None):
+        """Load a cached model, parsed graphs of recent models are kept in memory.
+
+        Returns:
+            tuple: Model and its ModelMetadata.
+        """
+        model_path, metadata_path = self.paths(digest)
+        self.touch(digest)
+
+        model = self.graphs.get(
+            digest,
+            lambda: Model.from_file(
+                model_path, ModelMetadata.from_file(metadata_path), config
+            ),
+        )
+
+        return model, model.metadata
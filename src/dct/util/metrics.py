@@ -0,0 +1,212 @@
+"""Counters, gauges and fixed-bucket histograms exposed in Prometheus text format.
+
+Metrics are defined once at module level, components get the child for their
+labels when they are created so recording a value on the frame path is a lock
+protected addition or a bisect into a short list of bucket bounds.
+"""
+import bisect
+import threading
+
+# Latency buckets in seconds, from half a millisecond to a few seconds.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value))
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+
+    def expose(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+
+        with self.lock:
+            metrics = list(self.metrics)
+
+        for metric in metrics:
+            lines.append("# HELP {} {}".format(metric.name, metric.help))
+            lines.append("# TYPE {} {}".format(metric.name, metric.type))
+
+            for suffix, labels, value in metric.samples():
+                lines.append("{}{}{} {}".format(metric.name, suffix, format_labels(labels), format_value(value)))
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class Value:
+    """Child of a counter or gauge, optionally read from a function at scrape time."""
+
+    __slots__ = ("value", "function", "lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """Report the return value of function instead, e.g. a queue length."""
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            value = self.function()
+            return 0.0 if value is None else value
+
+        return self.value
+
+
+class HistogramValue:
+    """Child of a histogram, counts per bucket are made cumulative at scrape time."""
+
+    __slots__ = ("bounds", "counts", "sum", "lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labels=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+
+        self.children = {}
+        self.lock = threading.Lock()
+
+        registry.register(self)
+
+    def new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **labels):
+        """Child for the given label values, created on first use."""
+        if labels:
+            values = tuple(labels[name] for name in self.label_names)
+
+        key = tuple(str(value) for value in values)
+        if len(key) != len(self.label_names):
+            raise ValueError("{} expects labels {}".format(self.name, self.label_names))
+
+        with self.lock:
+            if key not in self.children:
+                self.children[key] = self.new_child()
+
+            return self.children[key]
+
+    def items(self):
+        with self.lock:
+            return [(tuple(zip(self.label_names, key)), child) for key, child in self.children.items()]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def new_child(self):
+        return Value()
+
+    def samples(self):
+        for labels, child in self.items():
+            yield "", labels, child.get()
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, help, labels, registry)
+
+    def new_child(self):
+        return HistogramValue(self.bounds)
+
+    def samples(self):
+        for labels, child in self.items():
+            with child.lock:
+                counts = list(child.counts)
+                total = child.sum
+
+            cumulative = 0
+            for bound, count in zip(self.bounds + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", labels + (("le", format_value(bound)),), cumulative
+
+            yield "_sum", labels, total
+            yield "_count", labels, cumulative
+
+
+INGEST_FRAMES = Counter("dct_ingest_frames_total", "Frames received from the car.", ["car"])
+INGEST_BYTES = Counter("dct_ingest_bytes_total", "Camera feed bytes received from the car.", ["car"])
+INGEST_RECONNECTS = Counter("dct_ingest_reconnects_total", "Camera feed connections ended.", ["car"])
+INGEST_FPS = Gauge("dct_ingest_fps", "Measured framerate of the camera feed.", ["car"])
+INGEST_LEVEL = Gauge(
+    "dct_ingest_quality_level", "Steps below the configured quality of the camera feed, 0 is configured.", ["car"]
+)
+
+CONSUMER_DEPTH = Gauge("dct_consumer_queue_depth", "Frames waiting in a stream consumer.", ["stream", "consumer"])
+CONSUMER_DROPPED = Counter("dct_consumer_dropped_total", "Frames dropped by a stream consumer.", ["stream", "consumer"])
+
+VISUALIZER_FRAMES = Counter("dct_visualizer_frames_total", "Frames rendered.", ["visualizer"])
+VISUALIZER_DECODE = Histogram("dct_visualizer_decode_seconds", "JPEG decode time per frame.", ["visualizer"])
+VISUALIZER_ENCODE = Histogram("dct_visualizer_encode_seconds", "JPEG encode time per frame.", ["visualizer"])
+OVERLAY_SECONDS = Histogram("dct_overlay_seconds", "Overlay time per frame.", ["visualizer", "overlay"])
+
+BROADCASTER_CLIENTS = Gauge("dct_broadcaster_clients", "Connected viewers.", ["stream"])
+BROADCASTER_FRAMES = Counter("dct_broadcaster_frames_total", "Frames broadcast.", ["stream"])
+BROADCASTER_BYTES = Counter("dct_broadcaster_bytes_sent_total", "Bytes sent to viewers.", ["stream"])
+
+GRADCAM_INFERENCE = Histogram("dct_gradcam_inference_seconds", "GradCAM inference time per batch.", ["model"])
+GRADCAM_FRAMES = Counter("dct_gradcam_frames_total", "Frames run through GradCAM.", ["model"])
+GRADCAM_LATENCY = Gauge("dct_gradcam_latency_seconds", "Duration of the latest GradCAM inference of a car.", ["car"])
+GRADCAM_HEATMAP_AGE = Gauge(
+    "dct_gradcam_heatmap_age_seconds", "Time since the frame of the shown GradCAM heatmap was submitted.", ["car"]
+)
+GRADCAM_SWAP = Gauge("dct_gradcam_swap_seconds", "Time the latest model change of a car took to load.", ["car"])
+GRADCAM_DROPPED = Counter("dct_gradcam_dropped_total", "Frames replaced by a newer frame before inference.", ["car"])
@@ -1,9 +1,29 @@
+import hashlib
 import json
+import threading
+
 import tensorflow.compat.v1 as tf
 
 tf.disable_v2_behavior()
 
 
+def model_digest(model_pb_path: str):
+    """Content hash identifying a model.pb file, equal for the same model on any car.
+
+    Args:
+        model_pb_path (str): Path to the model.pb file.
+
+    Returns:
+        str: SHA-1 hex digest of the file.
+    """
+    digest = hashlib.sha1()
+    with open(model_pb_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
 class ModelMetadata:
     def __init__(self, sensor, network, simapp_version):
         self.sensor = sensor
@@ -67,66 +87,141 @@ class ModelMetadata:
             raise Exception("Error parsing model metadata: {}".format(e))
 
 
+# Defaults for the TensorFlow session, can be overridden from the "tensorflow" config.
+DEFAULT_SESSION_CONFIG = {
+    "intra_op_threads": 0,  # 0 lets TensorFlow pick the number of threads.
+    "inter_op_threads": 0,
+    "optimize": True,  # Apply graph optimizations (constant folding, CSE).
+    "log_device_placement": False,
+}
+
+
+def session_config(config=None):
+    """Build the TensorFlow session config.
+
+    Args:
+        config (dict, optional): Overrides for DEFAULT_SESSION_CONFIG.
+
+    Returns:
+        tf.ConfigProto: Session config.
+    """
+    options = dict(DEFAULT_SESSION_CONFIG, **(config or {}))
+
+    proto = tf.ConfigProto(
+        allow_soft_placement=True,
+        log_device_placement=options["log_device_placement"],
+        intra_op_parallelism_threads=options["intra_op_threads"],
+        inter_op_parallelism_threads=options["inter_op_threads"],
+    )
+    proto.graph_options.optimizer_options.opt_level = (
+        tf.OptimizerOptions.L1 if options["optimize"] else tf.OptimizerOptions.L0
+    )
+
+    return proto
+
+
 class Model:
     def __init__(self, session, metadata):
         self.metadata = metadata
         self.session = session
 
-    def input_size(self):
-        input = self.get_model_input()
-
-        height = input.shape[1]
-        width = input.shape[2]
+        # The session is closed once the model left the graph cache and no
+        # GradCamService uses it anymore.
+        self.users = 0
+        self.evicted = False
+        self.closed = False
+        self.lock = threading.Lock()
 
-        return (width, height)
+        self.cam = None  # GradCam with the gradient ops added to the graph, see GradCam.for_model.
 
-    def get_model_input(self):
+        # Resolve the tensors once, ops added later (e.g. by GradCam) do not change them.
         ops = self.session.graph.get_operations()
 
         # Select first operation output tensor.
-        return ops[0].outputs[0]
-
-    def get_model_output(self):
-        ops = self.session.graph.get_operations()
+        self.input = ops[0].outputs[0]
 
         # Select last operation output tensor.
-        return ops[-1].outputs[0]
+        self.output = ops[-1].outputs[0]
 
-    def get_model_convolutional_output(self):
-        # Get all convolutional ops.
-        ops = self.session.graph.get_operations()
-        conv_ops = list(filter(lambda x: "Conv2d" in x.name, ops))
+        # Select last convolutional op output tensor.
+        conv_ops = [op for op in ops if "Conv2d" in op.name]
+        self.conv_output = conv_ops[-1].outputs[0] if conv_ops else None
+
+        shape = self.input.shape
+        self.input_shape = tuple(
+            tf.compat.dimension_value(dimension) for dimension in shape
+        )
+
+    def retain(self):
+        """Mark the model as used by a GradCamService.
+
+        Raises:
+            Exception: If the session was already closed.
+        """
+        with self.lock:
+            if self.closed:
+                raise Exception("Model session was closed")
+
+            self.users += 1
+
+    def release(self):
+        """A GradCamService stopped using the model."""
+        with self.lock:
+            self.users -= 1
+            self.close_unused()
+
+    def evict(self):
+        """The model left the graph cache."""
+        with self.lock:
+            self.evicted = True
+            self.close_unused()
+
+    def close_unused(self):
+        if self.evicted and self.users == 0 and not self.closed:
+            self.closed = True
+            self.session.close()
+            self.cam = None
+
+    def input_size(self):
+        height = self.input_shape[1]
+        width = self.input_shape[2]
+
+        return (width, height)
+
+    def get_model_input(self):
+        return self.input
 
-        # Return last conv op.
-        return conv_ops[-1].outputs[0]
+    def get_model_output(self):
+        return self.output
+
+    def get_model_convolutional_output(self):
+        return self.conv_output
 
     @staticmethod
-    def from_file(model_pb_path: str, metadata: ModelMetadata):
+    def from_file(model_pb_path: str, metadata: ModelMetadata, config=None):
         """Load the TensorFlow graph for a model.pb model file.
 
         Args:
             pbpath (str): Path to the model.pb file
+            metadata (ModelMetadata): Metadata of the model.
+            config (dict, optional): Session options, see DEFAULT_SESSION_CONFIG.
 
         Raises:
             Exception: If the session cannot be loaded from the model file.
 
         Returns:
-            [tf.Session]: TensorFlow session object.
+            [Model]: The model, GradCam warms it up together with its gradient ops.
         """
         try:
-            tf.reset_default_graph()
-            sess = tf.Session(
-                config=tf.compat.v1.ConfigProto(
-                    allow_soft_placement=True, log_device_placement=True
-                )
-            )
-
             with tf.io.gfile.GFile(model_pb_path, "rb") as f:
                 graph_def = tf.GraphDef()
                 graph_def.ParseFromString(f.read())
 
-            sess.graph.as_default()
-            tf.import_graph_def(graph_def, name="")
+            graph = tf.Graph()
+            with graph.as_default():
+                tf.import_graph_def(graph_def, name="")
+
+            sess = tf.Session(graph=graph, config=session_config(config))
 
             return Model(sess, metadata)
         except Exception as e:
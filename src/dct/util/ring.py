@@ -0,0 +1,74 @@
+import threading
+
+
+class RingBuffer:
+    """Fixed capacity buffer which overwrites its oldest items.
+
+    Every appended item gets an increasing sequence number, readers keep their own
+    position by sequence number so a single buffer can serve any number of readers.
+    """
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("Ring buffer capacity should be at least 1")
+
+        self.capacity = capacity
+        self.items = [None] * capacity
+        self.head = 0  # Sequence number of the next item to be written.
+        self.condition = threading.Condition()
+
+    def __len__(self):
+        return min(self.head, self.capacity)
+
+    @property
+    def tail(self):
+        """Sequence number of the oldest item still in the buffer."""
+        return max(0, self.head - self.capacity)
+
+    def append(self, item):
+        """Add an item, overwriting the oldest one if the buffer is full.
+
+        Returns:
+            int: Sequence number of the item.
+        """
+        with self.condition:
+            sequence = self.head
+            self.items[sequence % self.capacity] = item
+            self.head = sequence + 1
+            self.condition.notify_all()
+
+        return sequence
+
+    def get(self, sequence):
+        """Get an item by sequence number.
+
+        Raises:
+            IndexError: If the item has not been written yet or was overwritten.
+        """
+        with self.condition:
+            if sequence < self.tail or sequence >= self.head:
+                raise IndexError("Sequence {} not in ring buffer".format(sequence))
+
+            return self.items[sequence % self.capacity]
+
+    def latest(self):
+        """Get the newest item.
+
+        Returns:
+            tuple: Sequence number and item, (-1, None) if nothing was written yet.
+        """
+        with self.condition:
+            sequence = self.head - 1
+            if sequence < 0:
+                return -1, None
+
+            return sequence, self.items[sequence % self.capacity]
+
+    def wait(self, sequence, timeout=None):
+        """Block until the item with the given sequence number has been written.
+
+        Returns:
+            bool: False if the timeout expired first.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.head > sequence, timeout)
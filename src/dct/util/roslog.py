@@ -0,0 +1,86 @@
+import collections
+import re
+import time
+
+DrivingEvent = collections.namedtuple("DrivingEvent", ["timestamp", "driving"])
+ModelEvent = collections.namedtuple("ModelEvent", ["timestamp", "model_name"])
+ThrottleEvent = collections.namedtuple("ThrottleEvent", ["timestamp", "throttle"])
+
+# All messages of interest in one pattern, none of the alternatives cross a line end.
+LOG_PATTERN = re.compile(
+    rb"Inference task [^\n]* has (?P<state>[^\"\n]*)"
+    rb"|Model '(?P<model>[^\n]*)' is installed"
+    rb"|Setting throttle to (?P<throttle>\d+\.\d+)"
+)
+
+
+class RosLogParser:
+    """Incremental parser for `rostopic echo /rosout_agg/msg` output.
+
+    Data is fed in blocks as read from the connection. Only complete lines are
+    scanned, in one pass over the block with a single compiled pattern, partial
+    lines are kept until the rest arrives. Telemetry found in the log is returned
+    as DrivingEvent, ModelEvent and ThrottleEvent tuples and sent to subscribers.
+
+    Args:
+        max_line_length (int): Partial lines longer than this are discarded.
+    """
+
+    def __init__(self, max_line_length=64 * 1024):
+        self.max_line_length = max_line_length
+        self.buffer = bytearray()
+        self.subscribers = []  # Callables called with each event.
+
+    def subscribe(self, subscriber):
+        self.subscribers.append(subscriber)
+
+    def reset(self):
+        """Drop buffered data, e.g. after reconnecting."""
+        del self.buffer[:]
+
+    def feed(self, chunk, timestamp=None):
+        """Parse a block of log output.
+
+        Args:
+            chunk (bytes): Data read from the log.
+            timestamp (float, optional): Arrival time of the data, defaults to now.
+
+        Returns:
+            list: Events in the complete lines of the data received so far.
+        """
+        self.buffer += chunk
+
+        end = self.buffer.rfind(b"\n")
+        if end == -1:
+            if len(self.buffer) > self.max_line_length:
+                self.reset()
+            return []
+
+        if timestamp is None:
+            timestamp = time.time()
+
+        events = self.parse(self.buffer, timestamp, end)
+        del self.buffer[: end + 1]
+
+        for event in events:
+            for subscriber in self.subscribers:
+                subscriber(event)
+
+        return events
+
+    @staticmethod
+    def parse(data, timestamp, end=None):
+        """Events in data up to end, without buffering or notifying subscribers."""
+        events = []
+
+        for match in LOG_PATTERN.finditer(data, 0, len(data) if end is None else end):
+            state, model, throttle = match.groups()
+
+            if state is not None:
+                events.append(DrivingEvent(timestamp, state.strip() == b"started"))
+            elif model is not None:
+                events.append(ModelEvent(timestamp, bytes(model).decode("utf-8", "replace")))
+            else:
+                events.append(ThrottleEvent(timestamp, float(throttle) * 100))
+
+        return events
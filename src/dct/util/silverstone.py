@@ -5,27 +5,48 @@ import pysftp
 import os
 import threading
 import time
-import re
 import logging
 import paramiko
+import socket
 
 from urllib3.connection import ConnectTimeoutError
-from dct.util.model import ModelMetadata, Model
+from dct.util.cache import ModelCache
+from dct.util.telemetry import TelemetrySeries
+from dct.util.roslog import DrivingEvent, ModelEvent, ThrottleEvent, RosLogParser
+
+ARTIFACTS_PATH = "/opt/aws/deepracer/artifacts"
 
 
 class DeepRacerCar:
-    def __init__(self, ip, ssh_password=None, name="Car", verbose=False):
+    def __init__(
+        self,
+        ip,
+        ssh_password=None,
+        name="Car",
+        verbose=False,
+        model_config=None,
+        model_cache=None,
+        telemetry_capacity=65536,
+        scheme="https",
+        log_port=None,
+    ):
         self.ip = ip
         self.ssh_password = ssh_password
-        self.base_url = "https://{}".format(ip)
+        self.base_url = "{}://{}".format(scheme, ip)
         self.name = name
 
+        # Simulated cars (dct simulate) stream their log over a plain socket and have no SSH.
+        self.log_port = log_port
+
         self.carThread = threading.Thread(target=self.monitor)
         self.carThread.daemon = True
 
         self.logThread = threading.Thread(target=self.roslog)
         self.logThread.daemon = True
 
+        self.prefetchThread = threading.Thread(target=self.prefetch)
+        self.prefetchThread.daemon = True
+
         self.tmpdir = tempfile.mkdtemp()
 
         self.session = requests.Session()
@@ -42,13 +63,32 @@ class DeepRacerCar:
         self.stereo_status = None
         self.lidar_status = None
 
+        # History of throttle, driving state and battery level.
+        self.telemetry = TelemetrySeries(telemetry_capacity)
+
         self.verbose = verbose
+        self.model_config = model_config  # TensorFlow session options for loaded models.
+        self.model_cache = model_cache or ModelCache()  # Model artifacts shared by all cars.
+        self.model_cache.cars += 1
+        self.model_digests = {}  # Model name to digest of the artifacts on the car.
+        self.model_listeners = []  # Callables notified with the new model name.
+
+        # Telemetry events from the ROS log, other components can subscribe as well.
+        self.log = RosLogParser()
+        self.log.subscribe(self._update_log_values)
 
     def __del__(self):
         if os.path.exists(self.tmpdir):
             shutil.rmtree(self.tmpdir)
 
+    @property
+    def simulated(self):
+        return self.log_port is not None
+
     def roslog(self):
+        if self.simulated:
+            return self.simulated_roslog()
+
         while True:
             try:
                 with paramiko.SSHClient() as client:
@@ -61,8 +101,27 @@ class DeepRacerCar:
                         "source /opt/ros/kinetic/setup.bash; rostopic echo /rosout_agg/msg",
                     )
 
-                    for line in iter(lambda: stdout.readline(2048), ""):
-                        self._update_log_values(line)
+                    # Read blocks as they arrive, the parser splits them in lines.
+                    self.log.reset()
+                    for chunk in iter(lambda: stdout.channel.recv(64 * 1024), b""):
+                        self.log.feed(chunk)
+            except Exception as e:
+                print(e)
+            finally:
+                # Retry every 5 seconds.
+                time.sleep(5)
+
+    def simulated_roslog(self):
+        host = self.ip.split(":")[0]
+
+        while True:
+            try:
+                with socket.create_connection((host, self.log_port), timeout=10) as sock:
+                    sock.settimeout(None)
+
+                    self.log.reset()
+                    for chunk in iter(lambda: sock.recv(64 * 1024), b""):
+                        self.log.feed(chunk)
             except Exception as e:
                 print(e)
             finally:
@@ -105,7 +164,64 @@ class DeepRacerCar:
         self.carThread.start()
         self.logThread.start()
 
+        # Models can only be downloaded over SSH.
+        if not self.simulated:
+            self.prefetchThread.start()
+
+    def prefetch(self):
+        while True:
+            try:
+                if self.connected:
+                    self.prefetch_models()
+            except Exception as e:
+                print(e)
+            finally:
+                # Look for new models every minute.
+                time.sleep(60)
+
+    def prefetch_models(self):
+        """Download all models on the car into the model cache and parse the most
+        likely ones, so switching models during a race does not wait for SFTP."""
+        with pysftp.Connection(
+            self.ip, username="deepracer", password=self.ssh_password
+        ) as sftp:
+            for model_name in sftp.listdir(ARTIFACTS_PATH):
+                try:
+                    self.model_digests[model_name] = self.model_cache.fetch(
+                        sftp, self.ip, "{}/{}".format(ARTIFACTS_PATH, model_name)
+                    )
+                except Exception as e:
+                    logging.debug(
+                        "Could not prefetch model '{}': {}".format(model_name, e)
+                    )
+
+        # Parse this car's share of the graph cache, so cars do not evict each other's
+        # models. The current model goes last so it is the most recently used.
+        share = max(1, self.model_cache.graphs.capacity // self.model_cache.cars)
+        names = sorted(self.model_digests, key=lambda name: name == self.model_name)
+        for model_name in names[-share:]:
+            digest = self.model_digests[model_name]
+            if digest not in self.model_cache.graphs:
+                self.model_cache.load(digest, self.model_config)
+
+        logging.info(
+            "Prefetched {} models from car '{}'".format(len(self.model_digests), self.name)
+        )
+
+    def resolve_model(self, model_name):
+        """Digest of a model, using the prefetched artifacts when available."""
+        if model_name in self.model_digests:
+            return self.model_digests[model_name]
+
+        return self.download_model(model_name)
+
     def _connect(self):
+        if self.simulated:
+            # The simulator does not check the token.
+            self.connected = True
+            logging.info("Simulated car '{}' connected!".format(self.name))
+            return
+
         try:
             logging.info("Attempting to connect to {}".format(self.name))
             deepracer_token_path = os.path.join(self.tmpdir, "token.txt")
@@ -136,6 +252,17 @@ class DeepRacerCar:
             logging.debug(e)
 
     def load_model(self, model_name):
+        digest = self.download_model(model_name)
+
+        return self.model_cache.load(digest, self.model_config)
+
+    def download_model(self, model_name):
+        """Make sure the model artifacts are in the model cache, downloading them only
+        if no car delivered this model before.
+
+        Returns:
+            str: Content hash of the model in the model cache.
+        """
         logging.info(
             "Loading model '{}' from car '{}'' at {}".format(
                 model_name, self.name, self.ip
@@ -145,30 +272,12 @@ class DeepRacerCar:
         with pysftp.Connection(
             self.ip, username="deepracer", password=self.ssh_password
         ) as sftp:
-            base_path = os.path.join(self.tmpdir, model_name)
-
-            if not os.path.exists(base_path):
-                os.makedirs(base_path)
-
-            model_path = os.path.join(self.tmpdir, model_name, "model.pb")
-            metadata_path = os.path.join(self.tmpdir, model_name, "model_metadata.json")
-
-            if not os.path.exists(model_path):
-                sftp.get(
-                    "/opt/aws/deepracer/artifacts/{}/model.pb".format(model_name),
-                    model_path,
-                )
-
-            if not os.path.exists(metadata_path):
-                sftp.get(
-                    "/opt/aws/deepracer/artifacts/{}/model_metadata.json".format(
-                        model_name
-                    ),
-                    metadata_path,
-                )
+            digest = self.model_cache.fetch(
+                sftp, self.ip, "{}/{}".format(ARTIFACTS_PATH, model_name)
+            )
 
-        metadata = ModelMetadata.from_file(metadata_path)
-        return Model.from_file(model_path, metadata), metadata
+        self.model_digests[model_name] = digest
+        return digest
 
     def camera_feed(self, width=480, height=360, quality=90, topic="display_mjpeg"):
         assert topic in ["display_mjpeg", "overlay_msg"], "Camera topic not supported!"
@@ -177,6 +286,15 @@ class DeepRacerCar:
             self.base_url, topic, width, height, quality
         )
 
+    def record_telemetry(self, timestamp=None):
+        """Add the current state of the car to its telemetry history."""
+        self.telemetry.append(
+            timestamp,
+            throttle=self.throttle,
+            driving=self.car_driving,
+            battery=self.battery_level,
+        )
+
     def _update_battery_level(self):
         res = self.session.get(
             "{}/api/get_battery_level".format(self.base_url), timeout=20
@@ -187,6 +305,7 @@ class DeepRacerCar:
         out = res.json()
         if out["success"] is True and self.battery_level != out["battery_level"]:
             self.battery_level = out["battery_level"]
+            self.record_telemetry()
             logging.info(
                 "{} battery level changed: {}".format(self.name, self.battery_level)
             )
@@ -225,19 +344,12 @@ class DeepRacerCar:
                     )
                 )
 
-    def _update_log_values(self, line):
-        if line == "---\n":
-            return
-
-        line = line.lstrip('"').rstrip('"\n')
-
+    def _update_log_values(self, event):
         # Check if car is running
-        match = re.search(r"Inference task .* has (.*)", line)
-        if match:
-            state = match[1]
-            car_driving = True if state == "started" else False
-            if self.car_driving != car_driving:
-                self.car_driving = car_driving
+        if isinstance(event, DrivingEvent):
+            if self.car_driving != event.driving:
+                self.car_driving = event.driving
+                self.record_telemetry(event.timestamp)
                 logging.info(
                     "Car '{}' driving state changed: {}".format(
                         self.name, self.car_driving
@@ -246,23 +358,24 @@ class DeepRacerCar:
             return
 
         # Find currently loaded model.
-        match = re.search(r"Model '(.*)' is installed", line)
-        if match:
-            if self.model_name != match[1]:
-                self.model_name = match[1]
+        if isinstance(event, ModelEvent):
+            if self.model_name != event.model_name:
+                self.model_name = event.model_name
                 logging.info(
                     "Car '{}' loaded model changed: {}".format(
                         self.name, self.model_name
                     )
                 )
+
+                for listener in self.model_listeners:
+                    listener(self.model_name)
             return
 
         # Find last throttle value.
-        match = re.search(r"Setting throttle to (\d+\.\d+)", line)
-        if match:
-            throttle = float(match[1]) * 100
-            if self.throttle != throttle:
-                self.throttle = throttle
+        if isinstance(event, ThrottleEvent):
+            if self.throttle != event.throttle:
+                self.throttle = event.throttle
+                self.record_telemetry(event.timestamp)
                 logging.info(
                     "Car '{}' throttle changed: {}".format(self.name, self.throttle)
                 )
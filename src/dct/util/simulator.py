@@ -0,0 +1,241 @@
+import http.server
+import json
+import logging
+import math
+import socket
+import socketserver
+import threading
+import time
+import urllib.parse
+
+import cv2
+import numpy as np
+
+from dct.camera.recorder import list_segments
+from dct.camera.replay import RecordedSegment
+
+# Multipart part of a frame with its capture time, as the web_video_server of the car sends it.
+PART = b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\nX-Timestamp: %.6f\r\n\r\n%s\r\n"
+
+
+def synthetic_frames(width, height, count=30):
+    """Frames with a moving gradient and frame number, like a camera looking at a track."""
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+
+    frames = []
+    for i in range(count):
+        phase = 255.0 * i / count
+        image = np.empty((height, width, 3), dtype=np.uint8)
+        image[:, :, 0] = (x + phase) % 256
+        image[:, :, 1] = (y + phase) % 256
+        image[:, :, 2] = 128
+
+        cv2.putText(image, str(i), (10, height - 10), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        frames.append(image)
+
+    return frames
+
+
+def recorded_frames(directory, count=300):
+    """Decoded frames from the first segment of a recording."""
+    segment = RecordedSegment(directory, list_segments(directory)[0])
+
+    return [
+        cv2.imdecode(np.frombuffer(segment.jpeg(i), dtype=np.uint8), cv2.IMREAD_COLOR)
+        for i in range(min(count, len(segment)))
+    ]
+
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    # http.server.ThreadingHTTPServer needs Python 3.7.
+    daemon_threads = True
+
+
+class SimulatedCar:
+    """Local stand-in for a DeepRacer car.
+
+    Serves the camera feed and the battery and sensor APIs over plain HTTP on
+    port, and the ROS log as `rostopic echo` output on log_port. Frames are
+    encoded once per requested resolution and quality and then sent in a loop.
+
+    Args:
+        name (str): Name of the car.
+        port (int): Port of the HTTP server.
+        log_port (int): Port of the log stream.
+        fps (float): Frames per second of the camera feed.
+        source (list): BGR frames to stream, synthetic frames if None.
+        model_name (str): Model reported as installed in the log.
+    """
+
+    def __init__(self, name, port, log_port, fps=15.0, source=None, model_name="simulated-model"):
+        self.name = name
+        self.port = port
+        self.log_port = log_port
+        self.fps = fps
+        self.source = source
+        self.model_name = model_name
+        self.started = time.time()
+
+        self.clients = 0  # Connected camera feed clients.
+        self.encoded = {}  # Encoded frames by (width, height, quality).
+
+        car = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                car.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        class LogHandler(socketserver.BaseRequestHandler):
+            def handle(self):
+                car.stream_log(self.request)
+
+        self.httpServer = _Server(("127.0.0.1", port), Handler)
+        self.logServer = socketserver.ThreadingTCPServer(("127.0.0.1", log_port), LogHandler)
+        self.logServer.daemon_threads = True
+
+        # Ports may be 0 to let the system pick them.
+        self.port = self.httpServer.server_address[1]
+        self.log_port = self.logServer.server_address[1]
+
+    def start(self):
+        for server in (self.httpServer, self.logServer):
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+
+        logging.info(
+            "Simulated car '{}' on port {}, log on port {}".format(self.name, self.port, self.log_port)
+        )
+
+    def stop(self):
+        for server in (self.httpServer, self.logServer):
+            server.shutdown()
+            server.server_close()
+
+    def config(self):
+        """Car entry for the config of dct server."""
+        return {
+            "name": self.name,
+            "ip": "127.0.0.1:{}".format(self.port),
+            "scheme": "http",
+            "log_port": self.log_port,
+        }
+
+    def encoded_frames(self, width, height, quality):
+        """JPEG encoded frames of the source at the requested size and quality."""
+        key = (width, height, quality)
+        if key not in self.encoded:
+            self.encoded[key] = self.encode_frames(width, height, quality)
+
+        return self.encoded[key]
+
+    def encode_frames(self, width, height, quality):
+        source = self.source if self.source is not None else synthetic_frames(width, height)
+
+        jpegs = []
+        for frame in source:
+            if frame.shape[:2] != (height, width):
+                frame = cv2.resize(frame, (width, height))
+
+            jpegs.append(cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+
+        return jpegs
+
+    def handle(self, request):
+        url = urllib.parse.urlsplit(request.path)
+
+        if url.path == "/route":
+            query = urllib.parse.parse_qs(url.query)
+            self.stream_camera(
+                request,
+                int(query.get("width", [480])[0]),
+                int(query.get("height", [360])[0]),
+                int(query.get("quality", [90])[0]),
+            )
+        elif url.path == "/api/get_battery_level":
+            # Drains one level every 10 minutes.
+            level = max(0, 10 - int((time.time() - self.started) / 600))
+            self.send_json(request, {"success": True, "battery_level": level})
+        elif url.path == "/api/get_sensor_status":
+            self.send_json(
+                request,
+                {
+                    "success": True,
+                    "camera_status": "connected",
+                    "stereo_status": "not_connected",
+                    "lidar_status": "not_connected",
+                },
+            )
+        else:
+            request.send_error(404)
+
+    def send_json(self, request, data):
+        body = json.dumps(data).encode()
+
+        request.send_response(200)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def stream_camera(self, request, width, height, quality):
+        frames = self.encoded_frames(width, height, quality)
+        request.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        request.send_response(200)
+        request.send_header("Content-Type", "multipart/x-mixed-replace;boundary=frame")
+        request.send_header("Transfer-Encoding", "chunked")
+        request.end_headers()
+
+        self.clients += 1
+        try:
+            next_frame = time.time()
+            i = 0
+
+            while True:
+                # One HTTP chunk per part, like the car, so each frame is a single write
+                # and can be read as soon as it arrives. Stamped with the capture time.
+                jpeg = frames[i % len(frames)]
+                part = PART % (len(jpeg), time.time(), jpeg)
+                request.wfile.write(b"%x\r\n%s\r\n" % (len(part), part))
+                i += 1
+
+                next_frame += 1.0 / self.fps
+                delay = next_frame - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # Fell behind, do not try to catch up with a burst.
+                    next_frame = time.time()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.clients -= 1
+
+    def stream_log(self, sock):
+        def message(text):
+            sock.sendall('"{}"\n---\n'.format(text).encode())
+
+        try:
+            message("Model '{}' is installed".format(self.model_name))
+
+            # Drive for 60 seconds, stop for 10 seconds.
+            while True:
+                message("Inference task (pid: 1234) has started")
+
+                start = time.time()
+                while time.time() - start < 60:
+                    throttle = 0.5 + 0.4 * math.sin(time.time())
+                    message("Setting throttle to {:.6f}".format(throttle))
+                    time.sleep(1 / 15.0)
+
+                message("Inference task (pid: 1234) has stopped")
+                time.sleep(10)
+        except (ConnectionError, OSError):
+            pass
@@ -0,0 +1,127 @@
+import collections
+import math
+import threading
+import time
+
+import numpy as np
+
+TelemetrySample = collections.namedtuple(
+    "TelemetrySample", ["timestamp", "throttle", "driving", "battery"]
+)
+
+
+class TelemetrySeries:
+    """Fixed size time series of car telemetry.
+
+    Samples are stored in preallocated numpy columns used as a ring buffer, so
+    appending is O(1) and memory does not grow with the session length. Every
+    sample holds the complete car state at its timestamp, unknown values are NaN.
+
+    Args:
+        capacity (int): Number of samples kept, the oldest are overwritten.
+    """
+
+    COLUMNS = ("timestamp", "throttle", "driving", "battery")
+
+    def __init__(self, capacity=65536):
+        if capacity < 1:
+            raise ValueError("Telemetry capacity should be at least 1")
+
+        self.capacity = capacity
+        self.timestamp = np.zeros(capacity, dtype=np.float64)
+        self.throttle = np.full(capacity, np.nan, dtype=np.float32)
+        self.driving = np.full(capacity, np.nan, dtype=np.float32)
+        self.battery = np.full(capacity, np.nan, dtype=np.float32)
+
+        self.head = 0  # Number of samples appended so far.
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.head, self.capacity)
+
+    def append(self, timestamp=None, throttle=None, driving=None, battery=None):
+        """Add a sample, None values are stored as NaN."""
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self.lock:
+            index = self.head % self.capacity
+
+            # Keep timestamps sorted for range queries, samples come from several threads.
+            if self.head > 0:
+                timestamp = max(timestamp, self.timestamp[(self.head - 1) % self.capacity])
+
+            self.timestamp[index] = timestamp
+            self.throttle[index] = np.nan if throttle is None else throttle
+            self.driving[index] = np.nan if driving is None else driving
+            self.battery[index] = np.nan if battery is None else battery
+            self.head += 1
+
+    def index(self, timestamp):
+        """Position of the last sample at or before timestamp, None if there is none.
+
+        Must be called with the lock held. The ring holds at most two sorted
+        segments, the older one after the write position, so a binary search in
+        one of them suffices.
+        """
+        if self.head <= self.capacity:
+            index = np.searchsorted(self.timestamp[: self.head], timestamp, side="right") - 1
+            return index if index >= 0 else None
+
+        split = self.head % self.capacity
+        if split > 0 and timestamp >= self.timestamp[0]:
+            return np.searchsorted(self.timestamp[:split], timestamp, side="right") - 1
+
+        index = split + np.searchsorted(self.timestamp[split:], timestamp, side="right") - 1
+        return index if index >= split else None
+
+    def at(self, timestamp):
+        """State of the car at a point in time, i.e. the last sample at or before it.
+
+        Returns:
+            TelemetrySample: The sample, unknown values are None. None if the
+                timestamp is before the oldest sample.
+        """
+        with self.lock:
+            index = self.index(timestamp)
+            if index is None:
+                return None
+
+            values = [float(getattr(self, name)[index]) for name in self.COLUMNS]
+
+        return TelemetrySample(*(None if math.isnan(value) else value for value in values))
+
+    def columns(self, start=None, end=None):
+        """Copies of the columns in chronological order, limited to [start, end]."""
+        with self.lock:
+            order = np.arange(max(0, self.head - self.capacity), self.head) % self.capacity
+            columns = {name: getattr(self, name)[order] for name in self.COLUMNS}
+
+        timestamps = columns["timestamp"]
+        first = 0 if start is None else np.searchsorted(timestamps, start, side="left")
+        last = len(timestamps) if end is None else np.searchsorted(timestamps, end, side="right")
+
+        return {name: column[first:last] for name, column in columns.items()}
+
+    def query(self, start=None, end=None, points=500):
+        """Samples in a time range, downsampled to at most the given number of points.
+
+        Args:
+            start (float, optional): Unix time of the first sample.
+            end (float, optional): Unix time of the last sample.
+            points (int): Maximum number of samples returned, evenly spread over the range.
+
+        Returns:
+            dict: List per column, NaN values are returned as None.
+        """
+        columns = self.columns(start, end)
+
+        count = len(columns["timestamp"])
+        if count > points:
+            indices = np.linspace(0, count - 1, max(1, points)).astype(np.int64)
+            columns = {name: column[indices] for name, column in columns.items()}
+
+        return {
+            name: [None if np.isnan(value) else value for value in column.tolist()]
+            for name, column in columns.items()
+        }
@@ -0,0 +1,160 @@
+"""Optional per-frame tracing of the latency between the hops of the pipeline.
+
+When enabled every frame from the car gets a FrameTrace with the wall clock time
+at which it passed each hop, from the chunk of the camera feed which completed it
+up to the moment a viewer's socket accepted the last byte of the rendered frame.
+Completed traces are kept per output stream in a sliding window and summarized as
+percentiles of the time spent between consecutive hops.
+
+Tracing is off by default, a disabled tracer hands out no traces so the hops only
+check for None.
+"""
+import collections
+import threading
+import time
+
+import numpy as np
+
+# Hops in pipeline order, indices into FrameTrace.times.
+HOPS = (
+    "received",  # Chunk of the camera feed which completed the frame was read.
+    "extracted",  # JPEG was extracted from the multipart stream.
+    "published",  # Frame was handed to the consumers of the stream.
+    "render_start",  # Visualizer picked up the frame.
+    "render_end",  # Visualizer finished decoding, overlays and encoding.
+    "prepared",  # Broadcaster built the multipart part.
+    "handed",  # A viewer's client took the part from the broadcaster.
+    "sent",  # The last byte of the part was accepted by the viewer's socket.
+)
+RECEIVED, EXTRACTED, PUBLISHED, RENDER_START, RENDER_END, PREPARED, HANDED, SENT = range(len(HOPS))
+
+PERCENTILES = (50, 90, 99)
+
+
+class FrameTrace:
+    """Times of a single frame at the hops it passed, None for hops not passed (yet).
+
+    One trace is shared by all consumers of a frame up to publishing, from there on
+    every visualizer continues on its own copy (see branch).
+    """
+
+    __slots__ = ("capture", "times")
+
+    def __init__(self, capture=None, times=None):
+        self.capture = capture  # Capture time reported by the car, None if unknown.
+        self.times = times if times is not None else [None] * len(HOPS)
+
+    def mark(self, hop, timestamp=None):
+        self.times[hop] = time.time() if timestamp is None else timestamp
+
+    def branch(self):
+        """Copy to continue the trace along one path of the pipeline."""
+        return FrameTrace(self.capture, list(self.times))
+
+
+def percentiles(values):
+    """Percentiles and maximum of durations in seconds, in milliseconds."""
+    values = values[~np.isnan(values)] * 1e3
+    if len(values) == 0:
+        return None
+
+    result = {"p{}".format(p): float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+    result["max"] = float(np.max(values))
+
+    return result
+
+
+class Tracer:
+    """Collects completed frame traces per output stream.
+
+    Args:
+        window (int): Traces kept per stream for the summary.
+    """
+
+    def __init__(self, window=1000):
+        self.enabled = False
+        self.window = window
+
+        self.traces = {}  # Rows of hop times (and capture time) per stream.
+        self.lock = threading.Lock()
+
+    def enable(self, window=None):
+        if window is not None:
+            self.window = window
+
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            self.traces = {}
+
+    def start(self, capture=None, received=None, extracted=None):
+        """New trace for a frame entering the pipeline, None when tracing is disabled."""
+        if not self.enabled:
+            return None
+
+        trace = FrameTrace(capture)
+        trace.times[RECEIVED] = received
+        trace.times[EXTRACTED] = extracted
+
+        return trace
+
+    def record(self, stream, trace, handed, sent):
+        """Add the trace of a frame which was sent to a viewer of stream."""
+        row = trace.times[:HANDED] + [handed, sent, trace.capture]
+
+        with self.lock:
+            rows = self.traces.get(stream)
+            if rows is None:
+                rows = self.traces[stream] = collections.deque(maxlen=self.window)
+
+            rows.append(row)
+
+    def summary(self):
+        """Latency percentiles per stream in milliseconds, as dumped to JSON.
+
+        Per stream, "hops" holds the time from the previous hop the frame passed to
+        each hop, "total" the time from the first hop to sent and "glass_to_glass"
+        the time from the capture time reported by the car to sent. The latter
+        depends on the clocks of the car and the server being in sync.
+        """
+        with self.lock:
+            traces = {stream: list(rows) for stream, rows in self.traces.items()}
+
+        streams = {}
+        for stream, rows in sorted(traces.items()):
+            data = np.array(rows, dtype=np.float64)  # None becomes NaN.
+            times, capture = data[:, : len(HOPS)], data[:, len(HOPS)]
+
+            # Time since the latest earlier hop which was passed.
+            previous = np.full(len(times), np.nan)
+            hops = {}
+            for i, hop in enumerate(HOPS):
+                if i > 0:
+                    hops[hop] = percentiles(times[:, i] - previous)
+
+                previous = np.where(np.isnan(times[:, i]), previous, times[:, i])
+
+            first = np.full(len(times), np.nan)
+            for i in reversed(range(len(HOPS))):
+                first = np.where(np.isnan(times[:, i]), first, times[:, i])
+
+            streams[stream] = {
+                "frames": len(rows),
+                "hops": hops,
+                "total": percentiles(times[:, SENT] - first),
+                "glass_to_glass": percentiles(times[:, SENT] - capture),
+            }
+
+        return {
+            "enabled": self.enabled,
+            "window": self.window,
+            "created": time.time(),
+            "streams": streams,
+        }
+
+
+TRACER = Tracer()
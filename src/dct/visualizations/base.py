@@ -1,11 +1,24 @@
+import time
+
 import cv2
 from dct.camera.stream import StreamConsumer
+from dct.util import metrics, tracing
 
 import numpy as np
 from .connection import ConnectionOverlay
 
 
 class VisualizationOverlay:
+    """Overlays receive read-only images shared between visualizers, use
+    dct.camera.frame.writable to get a copy before drawing in place."""
+
+    # Overlays which leave the frame untouched allow the source JPEG to be sent as is.
+    modifies_frame = True
+
+    def prepare(self, frame):
+        """Called with the source Frame before frame(), e.g. to use its telemetry."""
+        pass
+
     def placeholder(self, input_frame):
         raise NotImplementedError
 
@@ -16,18 +29,43 @@ class VisualizationOverlay:
 class BaseFrameVisualizer:
     """Base class which serves as a starting point for frame visualizations."""
 
-    def __init__(self, stream: StreamConsumer, width=480, height=360):
+    def __init__(self, stream: StreamConsumer, width=480, height=360, name="visualizer"):
         self.input_stream = stream
         self.width = width
         self.height = height
-        self.last_frame = np.zeros((height, width, 3), dtype=np.uint8)
-        self.visualizations = [ConnectionOverlay()]
+        self.last_frame = None
+        self.visualizations = []
+
+        # Metrics, labelled with the name of the visualizer.
+        self.name = name
+        self.frames = metrics.VISUALIZER_FRAMES.labels(name)
+        self.decode_seconds = metrics.VISUALIZER_DECODE.labels(name)
+        self.encode_seconds = metrics.VISUALIZER_ENCODE.labels(name)
+        self.overlay_seconds = []  # Histogram per overlay, in order of visualizations.
+
+        # Trace of the frame yielded last with the render hops marked, None if not traced.
+        self.trace = None
+
+        self.add(ConnectionOverlay())
 
     def add(self, viz: VisualizationOverlay):
         self.visualizations.append(viz)
+        self.overlay_seconds.append(
+            metrics.OVERLAY_SECONDS.labels(self.name, type(viz).__name__)
+        )
+
+    @property
+    def passthrough(self):
+        """True when none of the overlays change pixels, frames are then sent without re-encoding."""
+        return not any(
+            getattr(viz, "modifies_frame", True) for viz in self.visualizations
+        )
 
     def placeholder(self):
-        frame = self.last_frame.copy()
+        if self.last_frame is None:
+            frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        else:
+            frame = self.last_frame.writable_image()
 
         # Apply added placeholder modifications in order.
         for viz in self.visualizations:
@@ -35,16 +73,63 @@ class BaseFrameVisualizer:
 
         return cv2.imencode(".jpg", frame)[1].tobytes()
 
-    def generate_frames(self):
-        for input_frame in self.input_stream.frame_iterator():
-            frame = input_frame.copy()
+    def generate_frames(self, skip=None):
+        """Render the frames of the input stream.
 
-            if frame is None:
+        Args:
+            skip (callable, optional): Called for every input frame, if it returns True
+                the frame is not rendered (e.g. when nobody is watching).
+
+        Yields:
+            tuple: JPEG encoded output frame and the source Frame it was rendered from.
+                The trace of the yielded frame is available as `trace` until the next
+                frame is requested.
+        """
+        for input_frame in self.input_stream.frame_iterator():
+            if input_frame is None:
                 return
 
+            self.last_frame = input_frame
+
+            if skip is not None and skip():
+                continue
+
+            self.frames.inc()
+
+            # Every visualizer continues the shared trace of the frame on its own copy.
+            trace = input_frame.trace.branch() if input_frame.trace is not None else None
+            if trace is not None:
+                trace.mark(tracing.RENDER_START)
+
+            if self.passthrough:
+                if trace is not None:
+                    trace.mark(tracing.RENDER_END)
+                self.trace = trace
+
+                yield input_frame.jpeg, input_frame
+                continue
+
+            # Shared read-only image, overlays copy on write.
+            start = time.perf_counter()
+            frame = input_frame.image
+            self.decode_seconds.observe(time.perf_counter() - start)
+
             # Apply added visualizations in order.
-            for viz in self.visualizations:
+            for viz, seconds in zip(self.visualizations, self.overlay_seconds):
+                start = time.perf_counter()
+
+                if hasattr(viz, "prepare"):
+                    viz.prepare(input_frame)
+
                 frame = viz.frame(frame)
+                seconds.observe(time.perf_counter() - start)
 
-            self.last_frame = input_frame
-            yield cv2.imencode(".jpg", frame)[1].tobytes()
+            start = time.perf_counter()
+            data = cv2.imencode(".jpg", frame)[1].tobytes()
+            self.encode_seconds.observe(time.perf_counter() - start)
+
+            if trace is not None:
+                trace.mark(tracing.RENDER_END)
+            self.trace = trace
+
+            yield data, input_frame
@@ -2,6 +2,8 @@ from .util import get_font, write_text_on_image
 
 
 class ConnectionOverlay:
+    modifies_frame = False
+
     def __init__(self):
         self.amazon_ember_regular_20px = get_font("AmazonEmber-Regular", 20)
         self.dots = ""
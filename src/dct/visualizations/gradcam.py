@@ -3,46 +3,285 @@ import numpy as np
 import cv2
 import threading
 import time
+import logging
+from dct.util import metrics
 from dct.util.model import Model
 
 
 class GradCamOverlay:
-    def __init__(self, car):
+    """Blends the GradCAM heatmap of the car's current model onto frames.
+
+    Inference is done by the GradCamService of the model, shared with every other car
+    running the same model, fed with the newest frame only. Frames are blended with
+    the most recent heatmap so the video framerate does not depend on inference.
+
+    Model changes reported by the car are loaded in the background, the previous
+    model keeps rendering until the new one is built and warmed up.
+    """
+
+    def __init__(self, car, rate=5.0):
         self.car = car
-        self.gradcamThread = threading.Thread(target=self.monitor_model)
+        self.gradcamThread = threading.Thread(target=self.load_models)
         self.gradcamThread.daemon = True
 
+        self.rate = rate  # Target number of GradCAM inferences per second.
+
         self.active_model_name = None
-        self.model = None
+        self.requested_model_name = car.model_name
+        self.model_changed = threading.Condition()
         self.metadata = None
-        self.cam = None
+        self.service = None
+
+        self.heatmap = None  # GradCam and colored heatmap of the latest inference.
+        self.heatmap_time = None  # Submit time of the frame the heatmap was computed from.
+        self.inference_latency = None  # Duration of the latest (batched) inference in seconds.
+        self.swap_latency = None  # Seconds between a model change and its heatmaps.
+        self.inferences = 0
+        self.dropped = 0  # Frames replaced by a newer frame before inference.
 
+        metrics.GRADCAM_LATENCY.labels(car.name).set_function(lambda: self.inference_latency)
+        metrics.GRADCAM_HEATMAP_AGE.labels(car.name).set_function(lambda: self.heatmap_age)
+        metrics.GRADCAM_SWAP.labels(car.name).set_function(lambda: self.swap_latency)
+        metrics.GRADCAM_DROPPED.labels(car.name).set_function(lambda: self.dropped)
+
+        self.car.model_listeners.append(self.model_change)
         self.gradcamThread.start()
 
     def placeholder(self, input_frame):
         return input_frame
 
     def frame(self, input_frame):
-        if self.cam is None:
+        service, heatmap = self.service, self.heatmap
+        if service is None:
+            return input_frame
+
+        service.submit(self, input_frame)
+
+        if heatmap is None:
             return input_frame
 
-        result, frame = self.cam.process(input_frame)
+        # Blend with the GradCam that produced the heatmap, which may be the previous model.
+        cam, colored_heatmap = heatmap
+        return cam.blend(input_frame, colored_heatmap)
+
+    def deliver(self, heatmap, submitted, latency):
+        """Called by the GradCamService with the heatmap of a submitted frame."""
+        self.heatmap = heatmap
+        self.heatmap_time = submitted
+        self.inference_latency = latency
+        self.inferences += 1
+
+    @property
+    def heatmap_age(self):
+        if self.heatmap_time is None:
+            return None
+
+        return time.time() - self.heatmap_time
+
+    def stats(self):
+        return {
+            "model": self.active_model_name,
+            "inferences": self.inferences,
+            "dropped": self.dropped,
+            "inference_latency": self.inference_latency,
+            "heatmap_age": self.heatmap_age,
+            "swap_latency": self.swap_latency,
+        }
+
+    def model_change(self, model_name):
+        """Listener for model changes of the car."""
+        with self.model_changed:
+            self.requested_model_name = model_name
+            self.model_changed.notify()
+
+    def model_pending(self):
+        return self.requested_model_name not in (None, self.active_model_name)
+
+    def load_models(self):
+        while True:
+            with self.model_changed:
+                self.model_changed.wait_for(self.model_pending)
+                model_name = self.requested_model_name
+
+            start = time.time()
+
+            try:
+                digest = self.car.resolve_model(model_name)
+
+                service = GradCamService.acquire(
+                    digest,
+                    lambda: self.car.model_cache.load(digest, self.car.model_config)[0],
+                    self,
+                    rate=self.rate,
+                )
+            except Exception as e:
+                print(e)
+
+                # Retry in 5 seconds, unless the model changes again.
+                time.sleep(5)
+                continue
+
+            # Swap atomically, the old heatmap is rendered until the new model delivers one.
+            previous, self.service = self.service, service
+            self.metadata = service.cam.model.metadata
+            self.active_model_name = model_name
+            self.swap_latency = time.time() - start
+
+            if previous is not None and previous is not service:
+                previous.release(self)
+
+            logging.info(
+                "GradCAM for car '{}' switched to model '{}' in {:.3f}s".format(
+                    self.car.name, model_name, self.swap_latency
+                )
+            )
+
+
+class GradCamService:
+    """Runs batched GradCAM inference for all overlays whose car runs the same model.
+
+    One service (and so one TensorFlow graph) exists per model identity. The newest
+    frame of every subscribed overlay is collected and processed in a single
+    session.run, the heatmaps are then delivered back to each overlay.
+    """
+
+    services = {}  # Services by model identity.
+    loading = {}  # Event per model identity being loaded by the first acquire.
+    lock = threading.Lock()
+
+    def __init__(self, identity, model: Model, rate=5.0):
+        self.identity = identity
+        self.cam = GradCam.for_model(model)
+        model.retain()
+        self.rate = rate  # Target number of batched inferences per second.
+
+        self.inference_seconds = metrics.GRADCAM_INFERENCE.labels(identity[:12])
+        self.inferences = metrics.GRADCAM_FRAMES.labels(identity[:12])
+
+        self.subscribers = set()
+        self.pending = {}  # Newest frame and submit time per overlay.
+        self.frame_available = threading.Condition()
+        self.stopped = False
+
+        self.workerThread = threading.Thread(target=self.process_frames)
+        self.workerThread.daemon = True
+        self.workerThread.start()
+
+    @classmethod
+    def acquire(cls, identity, load_model, overlay, rate=5.0):
+        """Get the service of a model, loading the model if no car uses it yet.
+
+        Args:
+            identity (str): Model identity, e.g. its content hash.
+            load_model (callable): Returns the Model when no service exists yet.
+            overlay (GradCamOverlay): Overlay which will submit frames.
+            rate (float): Target inference rate for a new service.
+
+        Returns:
+            GradCamService: The shared service.
+        """
+        while True:
+            with cls.lock:
+                service = cls.services.get(identity)
+                if service is not None:
+                    service.subscribers.add(overlay)
+                    return service
+
+                loading = cls.loading.get(identity)
+                if loading is None:
+                    loading = cls.loading[identity] = threading.Event()
+                    break
+
+            # Another overlay is loading the model, share its service or retry if
+            # loading failed.
+            loading.wait()
+
+        # Load outside the lock so other cars can swap and release meanwhile.
+        service = None
+        try:
+            service = GradCamService(identity, load_model(), rate=rate)
+
+            # Build and run the gradient ops once before any frame depends on them.
+            service.cam.warmup()
+
+            with cls.lock:
+                cls.services[identity] = service
+                service.subscribers.add(overlay)
+        except Exception:
+            if service is not None:
+                service.stop()
+            raise
+        finally:
+            with cls.lock:
+                cls.loading.pop(identity, None)
+            loading.set()
+
+        return service
+
+    def release(self, overlay):
+        with GradCamService.lock:
+            self.subscribers.discard(overlay)
+
+            if not self.subscribers:
+                GradCamService.services.pop(self.identity, None)
+                self.stop()
+
+    def stop(self):
+        with self.frame_available:
+            self.stopped = True
+            self.frame_available.notify()
 
-        return frame
+    def submit(self, overlay, input_frame):
+        with self.frame_available:
+            if overlay in self.pending:
+                overlay.dropped += 1
 
-    def monitor_model(self):
+            self.pending[overlay] = (input_frame, time.time())
+            self.frame_available.notify()
+
+    def process_frames(self):
         while True:
-            if self.active_model_name != self.car.model_name:
-                self.cam = None
+            with self.frame_available:
+                self.frame_available.wait_for(lambda: self.pending or self.stopped)
+                if self.stopped:
+                    # No inference runs anymore, the session may be closed.
+                    self.cam.model.release()
+                    return
+
+                pending, self.pending = self.pending, {}
+
+            overlays = list(pending.keys())
+            start = time.time()
+
+            try:
+                heatmaps = self.cam.heatmaps([pending[o][0] for o in overlays])
+                latency = time.time() - start
+
+                self.inference_seconds.observe(latency)
+                self.inferences.inc(len(overlays))
 
-                self.model, self.metadata = self.car.load_model(self.car.model_name)
-                self.cam = GradCam(self.model)
-                self.active_model_name = self.car.model_name
+                for overlay, (_, heatmap) in zip(overlays, heatmaps):
+                    overlay.deliver(
+                        (self.cam, self.cam.colorize(heatmap)), pending[overlay][1], latency
+                    )
+            except Exception as e:
+                print(e)
 
-            time.sleep(0.1)
+            # Limit the inference rate, frames arriving meanwhile replace each other.
+            time.sleep(max(0.0, 1.0 / self.rate - (time.time() - start)))
 
 
 class GradCam:
+    @staticmethod
+    def for_model(model: Model):
+        # Kept on the model, cached models are reused without adding gradient ops again
+        # and the GradCam is freed together with its model.
+        with model.lock:
+            if model.cam is None:
+                model.cam = GradCam(model)
+
+            return model.cam
+
     def __init__(self, model: Model):
         self.model = model
 
@@ -51,46 +290,101 @@ class GradCam:
         self.output_layer = self.model.get_model_output()
         self.conv_output = self.model.get_model_convolutional_output()
 
-        # Get output for this action
-        y_c = tf.reduce_sum(
-            tf.multiply(
-                self.output_layer,
-                tf.one_hot(
-                    [tf.argmax(self.output_layer)], self.output_layer.shape[-1]
-                ),  # TODO: Argmax selects target action for PPO, also allow manual action idx to be specified.
-            ),
-            axis=1,
-        )
+        # Batches are only possible if the model input does not fix the batch size.
+        self.batchable = tf.compat.dimension_value(self.input_layer.shape[0]) is None
 
-        # Compute gradients based on last cnn layer
-        self.target_grads = tf.gradients(y_c, self.conv_output)[0]
+        with self.model.session.graph.as_default():
+            # Output of the selected action per sample.
+            y_c = tf.reduce_sum(
+                tf.multiply(
+                    self.output_layer,
+                    tf.one_hot(
+                        tf.argmax(self.output_layer, axis=1),
+                        self.output_layer.shape[-1],
+                    ),  # TODO: Argmax selects target action for PPO, also allow manual action idx to be specified.
+                ),
+                axis=1,
+            )
 
-    def process(self, input):
+            # Compute gradients based on last cnn layer, samples are independent so
+            # the gradient of the sum gives the per sample gradients.
+            self.target_grads = tf.gradients(y_c, self.conv_output)[0]
+
+    def warmup(self):
+        """Run the model and the gradient ops once so the first frame does not pay for graph setup."""
+        width, height = self.model.input_size()
+        self.heatmaps([np.zeros((height, width, 3), dtype=np.uint8)])
+
+    def preprocess(self, input):
         input_resized = cv2.resize(input, self.model.input_size())
         input_preprocessed = cv2.cvtColor(input_resized, cv2.COLOR_BGR2GRAY)
 
-        input_frame = np.expand_dims(input_preprocessed, axis=2)
+        return np.expand_dims(input_preprocessed, axis=2)
+
+    def heatmap(self, input):
+        """Run the model on a frame and compute its class activation map.
+
+        Args:
+            input (numpy.ndarray): BGR frame.
+
+        Returns:
+            tuple: Model output and heatmap in [0, 1] at the model input size.
+        """
+        return self.heatmaps([input])[0]
+
+    def heatmaps(self, inputs):
+        """Run the model on a batch of frames in a single session.run if possible.
+
+        Args:
+            inputs (list): BGR frames.
+
+        Returns:
+            list: Model output and heatmap per frame, see heatmap.
+        """
+        batch = np.stack([self.preprocess(input) for input in inputs])
         ops = [self.output_layer, self.conv_output, self.target_grads]
 
-        feed_dict = {self.input_layer: [input_frame]}
+        if self.batchable:
+            runs = [batch]
+        else:
+            runs = [batch[i : i + 1] for i in range(len(batch))]
 
-        result, out, grads_value = self.model.session.run(ops, feed_dict=feed_dict)
-        result, out, grads_value = result[0, :], out[0, :], grads_value[0, :, :, :]
+        outputs = [self.model.session.run(ops, feed_dict={self.input_layer: run}) for run in runs]
+        results, outs, grads_values = [np.concatenate(output) for output in zip(*outputs)]
 
-        weights = np.mean(grads_value, axis=(0, 1))
-        cam = np.dot(out, weights)
+        heatmaps = []
+        for result, out, grads_value in zip(results, outs, grads_values):
+            weights = np.mean(grads_value, axis=(0, 1))
+            cam = np.dot(out, weights)
 
-        # ReLU (only positive values are of interest)
-        cam = np.maximum(0, cam)
-        cam = cam / np.max(cam)
+            # ReLU (only positive values are of interest)
+            cam = np.maximum(0, cam)
+            cam = cam / max(np.max(cam), 1e-8)
 
-        # Scale back to resized input frame dimensions.
-        input_h, input_w = input_resized.shape[:2]
-        cam = cv2.resize(cam, (input_w, input_h))
+            # Scale back to resized input frame dimensions.
+            cam = cv2.resize(cam, self.model.input_size())
+
+            heatmaps.append((result, cam))
+
+        return heatmaps
+
+    def colorize(self, heatmap):
+        return cv2.applyColorMap(np.uint8(255 * heatmap), cv2.COLORMAP_JET)
+
+    def blend(self, input, colored_heatmap):
+        """Blend a colorized heatmap onto a frame.
+
+        Args:
+            input (numpy.ndarray): BGR frame.
+            colored_heatmap (numpy.ndarray): Output of colorize at the model input size.
+
+        Returns:
+            numpy.ndarray: Blended frame at the size of the input frame.
+        """
+        input_resized = cv2.resize(input, self.model.input_size())
 
         # Blend
-        cam = cv2.applyColorMap(np.uint8(255 * cam), cv2.COLORMAP_JET)
-        cam = np.float32(cam) + np.float32(input_resized)
+        cam = np.float32(colored_heatmap) + np.float32(input_resized)
         cam = 255 * cam / np.max(cam)
         cam = np.uint8(cam)
 
@@ -100,4 +394,9 @@ class GradCam:
         input_h, input_w = input.shape[:2]
         cam = cv2.resize(cam, (input_w, input_h))
 
-        return result, cam
+        return cam
+
+    def process(self, input):
+        result, heatmap = self.heatmap(input)
+
+        return result, self.blend(input, self.colorize(heatmap))
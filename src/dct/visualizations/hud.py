@@ -1,12 +1,14 @@
 import os
 import cv2
+import numpy as np
 
 from dct.visualizations.base import VisualizationOverlay
 from dct.util.silverstone import DeepRacerCar
 from dct.visualizations.util import (
+    AlphaBlender,
+    blit_sprite,
     get_font,
-    apply_gradient,
-    write_text_on_image,
+    render_text_sprite,
 )
 
 OVERLAY_PATH = os.path.join(
@@ -20,8 +22,36 @@ FONT_PATH = os.path.join(
     os.path.dirname(__file__), "..", "assets", "fonts", "AmazonEmber-Regular.ttf"
 )
 
+TEXT_COLOR = (255, 255, 255)
+TEXT_SHADOW_COLOR = (26, 26, 26)
+
+
+def draw_text_on_layer(layer, text, loc, font):
+    """Draw text with its shadow on a BGRA layer in place.
+
+    Args:
+        layer (numpy.ndarray): BGRA layer which is modified in place.
+        text (str): Text to draw.
+        loc (tuple): Pixel location (x, y) of the text.
+        font (ImageFont): The font style object.
+    """
+    sprite = render_text_sprite(text, font, TEXT_COLOR, TEXT_SHADOW_COLOR)
+    blit_sprite(layer, sprite, loc)
+
 
 class HudOverlay(VisualizationOverlay):
+    """Draws the car HUD.
+
+    The HUD consists of a static layer (overlay gradient and car name) which is built
+    once per resolution, and a dynamic layer with the model name, driving state and
+    throttle. Both are combined into a single AlphaBlender which is only rebuilt
+    when the displayed telemetry changes, so each frame costs a single blend of the
+    regions covered by the HUD.
+
+    Driving state and throttle are taken from the telemetry at the arrival time of
+    the frame, falling back to the current car state when there is none.
+    """
+
     def __init__(self, car: DeepRacerCar):
         super().__init__()
 
@@ -31,85 +61,126 @@ class HudOverlay(VisualizationOverlay):
         self.amazon_ember_light_13px = get_font("AmazonEmber-Light", 13)
         self.amazon_ember_regular_20px = get_font("AmazonEmber-Regular", 20)
 
+        self.static_layers = {}  # Static layers by (width, height, placeholder).
+        self.placeholders = {}  # Placeholder blenders by (width, height).
+        self.hud_key = None
+        self.hud = None
+        self.output = None  # Reused output frame when the input frame is shared.
+        self.telemetry = None  # TelemetrySample of the frame being rendered.
+
+    def prepare(self, frame):
+        self.telemetry = frame.telemetry
+
     def load_overlay(self, width, height):
         return cv2.resize(
             cv2.imread(OVERLAY_PATH, cv2.IMREAD_UNCHANGED),
             (width, height),
         )
 
-    def placeholder(self, input_frame):
-        width = input_frame.shape[1]
-        height = input_frame.shape[0]
-
-        if self.overlay is None:
-            self.overlay = self.load_overlay(width, height)
+    def static_layer(self, width, height, placeholder=False):
+        key = (width, height, placeholder)
 
-        frame = cv2.cvtColor(input_frame, cv2.COLOR_RGB2RGBA)
-        frame_overlay = self.overlay.copy()
-        frame_overlay[height - int(height / 4) :, :width, :] = 0
+        if key not in self.static_layers:
+            if self.overlay is None or self.overlay.shape[:2] != (height, width):
+                self.overlay = self.load_overlay(width, height)
 
-        gradient_alpha = frame_overlay[:, :, 3] / 255.0
+            layer = self.overlay.copy()
+            if placeholder:
+                layer[height - int(height / 4) :, :width, :] = 0
 
-        frame = apply_gradient(frame, frame_overlay, gradient_alpha)
-        frame = write_text_on_image(
-            image=frame,
-            text=self.car.name,
-            loc=(7, 1),
-            font=self.amazon_ember_regular_20px,
-            font_color=(255, 255, 255),
-            font_shadow_color=(26, 26, 26),
-        )
-
-        return frame
+            draw_text_on_layer(
+                layer, self.car.name, (7, 1), self.amazon_ember_regular_20px
+            )
+            self.static_layers[key] = layer
 
-    def frame(self, input_frame):
-        width = input_frame.shape[1]
-        height = input_frame.shape[0]
+        return self.static_layers[key]
 
-        if self.overlay is None:
-            self.overlay = self.load_overlay(width, height)
+    def dynamic_texts(self, height):
+        """Telemetry texts currently shown on the HUD, with location and font.
 
-        frame = cv2.cvtColor(input_frame, cv2.COLOR_RGB2RGBA)
-        gradient_alpha = self.overlay[:, :, 3] / 255.0
+        The driving state and speed are placed relative to the bottom of the frame,
+        the feed shrinks while its quality is reduced.
+        """
+        texts = []
 
-        frame = apply_gradient(frame, self.overlay, gradient_alpha)
-        frame = write_text_on_image(
-            image=frame,
-            text=self.car.name,
-            loc=(7, 1),
-            font=self.amazon_ember_regular_20px,
-            font_color=(255, 255, 255),
-            font_shadow_color=(26, 26, 26),
-        )
+        if self.telemetry is not None:
+            car_driving = self.telemetry.driving
+            throttle = self.telemetry.throttle
+        else:
+            car_driving = self.car.car_driving
+            throttle = self.car.throttle
 
         if self.car.model_name is not None:
-            frame = write_text_on_image(
-                image=frame,
-                text="Model | {}".format(self.car.model_name),
-                loc=(7, 35),
-                font=self.amazon_ember_light_13px,
-                font_color=(255, 255, 255),
-                font_shadow_color=(26, 26, 26),
+            texts.append(
+                (
+                    "Model | {}".format(self.car.model_name),
+                    (7, 35),
+                    self.amazon_ember_light_13px,
+                )
+            )
+
+        if car_driving is not None:
+            texts.append(
+                (
+                    "{}".format("Driving" if car_driving else "Stopped"),
+                    (7, height - 54),
+                    self.amazon_ember_light_13px,
+                )
             )
 
-        if self.car.car_driving is not None:
-            frame = write_text_on_image(
-                image=frame,
-                text="{}".format("Driving" if self.car.car_driving else "Stopped"),
-                loc=(7, 306),
-                font=self.amazon_ember_light_13px,
-                font_color=(255, 255, 255),
-                font_shadow_color=(26, 26, 26),
+        if throttle is not None:
+            texts.append(
+                (
+                    "Speed {:d}%".format(int(round(throttle))),
+                    (7, height - 28),
+                    self.amazon_ember_regular_16px,
+                )
             )
 
-        if self.car.throttle is not None:
-            frame = write_text_on_image(
-                image=frame,
-                text="Speed {:d}%".format(int(round(self.car.throttle))),
-                loc=(7, 332),
-                font=self.amazon_ember_regular_16px,
-                font_color=(255, 255, 255),
-                font_shadow_color=(26, 26, 26),
+        return texts
+
+    def hud_layer(self, width, height):
+        texts = self.dynamic_texts(height)
+        key = (width, height, tuple(text for text, _, _ in texts))
+
+        if key != self.hud_key:
+            layer = self.static_layer(width, height).copy()
+
+            for text, loc, font in texts:
+                draw_text_on_layer(layer, text, loc, font)
+
+            self.hud = AlphaBlender(layer)
+            self.hud_key = key
+
+        return self.hud
+
+    def output_frame(self, input_frame):
+        # Blend in place into private frames, shared read-only frames go to a reused buffer.
+        if input_frame.flags.writeable:
+            return input_frame
+
+        if self.output is None or self.output.shape != input_frame.shape:
+            self.output = np.empty(input_frame.shape, dtype=np.uint8)
+
+        return self.output
+
+    def placeholder(self, input_frame):
+        width = input_frame.shape[1]
+        height = input_frame.shape[0]
+
+        if (width, height) not in self.placeholders:
+            self.placeholders[(width, height)] = AlphaBlender(
+                self.static_layer(width, height, placeholder=True)
             )
 
-        return frame
+        return self.placeholders[(width, height)].blend(
+            input_frame, out=self.output_frame(input_frame)
+        )
+
+    def frame(self, input_frame):
+        width = input_frame.shape[1]
+        height = input_frame.shape[0]
+
+        return self.hud_layer(width, height).blend(
+            input_frame, out=self.output_frame(input_frame)
+        )
@@ -1,9 +1,11 @@
 import os
-import cv2
+import functools
 
 from PIL import ImageFont, Image, ImageDraw
 import numpy as np
 
+from dct.camera.frame import writable
+
 
 def get_font(font_name, font_size):
     """Helper method that returns an ImageFont object for the desired font if
@@ -26,10 +28,124 @@ def get_font(font_name, font_size):
     return font
 
 
+class TextSprite:
+    """Text with shadow rendered once into a small pre-multiplied BGR + alpha image.
+
+    Stored in uint16 fixed point (see AlphaBlender) so it can be blitted onto
+    frames without converting them to PIL images.
+    """
+
+    __slots__ = ("text_size", "alpha", "inverse_alpha", "premultiplied")
+
+    def __init__(self, text_size, coverage, color):
+        self.text_size = text_size  # Size of the text itself (w, h), as PIL textsize.
+        self.alpha = coverage  # Float32 coverage (h, w, 1) in [0, 1].
+
+        self.inverse_alpha = np.round(255 * (1 - coverage)).astype(np.uint16)
+        self.premultiplied = (np.round(65025 * color) + 128).astype(np.uint16)
+
+    @property
+    def shape(self):
+        return self.alpha.shape[:2]
+
+
+def text_size(font, text):
+    """Size (w, h) of text for the given font."""
+    if hasattr(font, "getbbox"):
+        left, top, right, bottom = font.getbbox(text)
+        return right, bottom
+
+    return font.getsize(text)
+
+
+@functools.lru_cache(maxsize=256)
+def render_text_sprite(text, font, font_color, font_shadow_color):
+    """Render text with the same shadow as draw_shadow into a cached TextSprite.
+
+    Args:
+        text (str): The text to render
+        font (ImageFont): The font style object
+        font_color (tuple): RGB value of the font
+        font_shadow_color (tuple): RGB color of the font shadow
+
+    Returns:
+        TextSprite: Sprite whose origin is one pixel up and left of the text location.
+    """
+    w, h = text_size(font, text)
+    size = (max(1, w) + 2, max(1, h) + 2)
+
+    # Coverage masks, drawing on "L" images composites the same way as drawing on the frame.
+    text_mask = Image.new("L", size, 0)
+    ImageDraw.Draw(text_mask).text((1, 1), text, font=font, fill=255)
+
+    shadow_mask = Image.new("L", size, 0)
+    draw_shadow(ImageDraw.Draw(shadow_mask), text, font, 1, 1, 255)
+
+    text_alpha = np.asarray(text_mask, dtype=np.float32)[:, :, None] / 255.0
+    shadow_alpha = np.asarray(shadow_mask, dtype=np.float32)[:, :, None] / 255.0 * (1 - text_alpha)
+
+    # Colors are given as RGB, frames are BGR.
+    text_bgr = np.array(font_color[::-1], dtype=np.float32) / 255.0
+    shadow_bgr = np.array(font_shadow_color[::-1], dtype=np.float32) / 255.0
+
+    return TextSprite(
+        (w, h),
+        text_alpha + shadow_alpha,
+        text_bgr * text_alpha + shadow_bgr * shadow_alpha,
+    )
+
+
+def blit_sprite(image, sprite, loc):
+    """Alpha blend a sprite into image in place, only touching the sprite region.
+
+    BGR images are blended in fixed point, for BGRA layers the sprite is composited
+    over the layer, including its alpha channel.
+
+    Args:
+        image (numpy.ndarray): Writable BGR or BGRA image.
+        sprite (TextSprite): Rendered text.
+        loc (tuple): Pixel location (x, y) of the text.
+    """
+    sprite_h, sprite_w = sprite.shape
+    x = int(loc[0]) - 1
+    y = int(loc[1]) - 1
+
+    # Clip the sprite to the image.
+    left, top = max(0, -x), max(0, -y)
+    right = min(sprite_w, image.shape[1] - x)
+    bottom = min(sprite_h, image.shape[0] - y)
+    if right <= left or bottom <= top:
+        return image
+
+    target = image[y + top : y + bottom, x + left : x + right]
+    crop = (slice(top, bottom), slice(left, right))
+
+    if image.shape[2] == 3:
+        blended = target * sprite.inverse_alpha[crop] + sprite.premultiplied[crop]
+        blended += blended >> 8
+        target[...] = blended >> 8
+    else:
+        alpha = sprite.alpha[crop]
+        target_alpha = target[:, :, 3:4] / 255.0 * (1 - alpha)
+        out_alpha = alpha + target_alpha
+
+        premultiplied = (sprite.premultiplied[crop] - 128) / 65025.0
+        color = premultiplied + target[:, :, :3] / 255.0 * target_alpha
+        color = np.divide(color, out_alpha, out=np.zeros_like(color), where=out_alpha > 0)
+
+        target[:, :, :3] = np.round(color * 255)
+        target[:, :, 3:4] = np.round(out_alpha * 255)
+
+    return image
+
+
 def write_text_on_image(
     image, text, loc, font, font_color, font_shadow_color, centered=False
 ):
-    """This function is used to write the text on the image using cv2 writer
+    """This function is used to write the text on the image using cached text sprites
+
+    The image is drawn on in place if it is writable, read-only (shared) images are
+    copied first.
 
     Args:
         image (Image): The image where the text should be written
@@ -42,17 +158,13 @@ def write_text_on_image(
     Returns:
         Image: Edited image
     """
-    image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    pil_im = Image.fromarray(image)
-    draw = ImageDraw.Draw(pil_im)
+    sprite = render_text_sprite(text, font, tuple(font_color), tuple(font_shadow_color))
 
     if centered:
-        w, h = draw.textsize(text, font=font)
+        w, h = sprite.text_size
         loc = ((loc[0] - w / 2), (loc[1] - h / 2))
 
-    draw_shadow(draw, text, font, loc[0], loc[1], font_shadow_color)
-    draw.text(loc, text, font=font, fill=font_color)
-    return cv2.cvtColor(np.array(pil_im), cv2.COLOR_RGB2BGR)
+    return blit_sprite(writable(image), sprite, loc)
 
 
 def draw_shadow(draw_obj, text, font, x_loc, y_loc, shadowcolor):
@@ -89,3 +201,84 @@ def apply_gradient(main_image, gradient_img, gradient_alpha):
             main_image[-gradient_img.shape[0] :, -gradient_img.shape[1] :, channel]
         )
     return main_image
+
+
+class AlphaBlender:
+    """Blends a fixed BGRA overlay onto BGR frames.
+
+    The overlay is split into horizontal bands and the bounding box of the non-zero
+    alpha in each band is computed once. Per frame only those regions are blended,
+    using uint16 fixed-point arithmetic on the 3 color channels.
+
+    Args:
+        overlay (numpy.ndarray): BGRA overlay with the same size as the frames.
+        band_height (int): Height of the bands used to find the blended regions.
+    """
+
+    def __init__(self, overlay, band_height=16):
+        self.shape = overlay.shape[:2] + (3,)
+        self.regions = []
+
+        alpha = overlay[:, :, 3]
+        for top in range(0, alpha.shape[0], band_height):
+            band = alpha[top : top + band_height]
+
+            rows = np.flatnonzero(band.any(axis=1))
+            cols = np.flatnonzero(band.any(axis=0))
+            if len(rows) == 0:
+                continue
+
+            region = (
+                slice(top + rows[0], top + rows[-1] + 1),
+                slice(cols[0], cols[-1] + 1),
+            )
+
+            region_alpha = overlay[region][:, :, 3:4].astype(np.uint16)
+            inverse_alpha = 255 - region_alpha
+            # Color weighted by alpha plus 128 to round the division by 255.
+            premultiplied = overlay[region][:, :, :3].astype(np.uint16) * region_alpha + 128
+
+            self.regions.append(
+                (
+                    region,
+                    inverse_alpha,
+                    premultiplied,
+                    np.empty(premultiplied.shape, dtype=np.uint16),
+                    np.empty(premultiplied.shape, dtype=np.uint16),
+                )
+            )
+
+    @property
+    def coverage(self):
+        """Fraction of the frame which is blended."""
+        pixels = sum(inverse.shape[0] * inverse.shape[1] for _, inverse, _, _, _ in self.regions)
+        return pixels / float(self.shape[0] * self.shape[1])
+
+    def blend(self, frame, out=None):
+        """Blend the overlay onto a frame.
+
+        Args:
+            frame (numpy.ndarray): BGR frame, not modified unless it is also out.
+            out (numpy.ndarray, optional): Preallocated BGR output, may be frame itself
+                to blend in place. A new array is allocated when omitted.
+
+        Returns:
+            numpy.ndarray: The blended frame (out).
+        """
+        if out is None:
+            out = frame.copy()
+        elif out is not frame:
+            np.copyto(out, frame)
+
+        for region, inverse_alpha, premultiplied, blended, shifted in self.regions:
+            np.multiply(frame[region], inverse_alpha, out=blended)
+            blended += premultiplied
+
+            # Exact rounded division by 255: (x + (x >> 8)) >> 8
+            np.right_shift(blended, 8, out=shifted)
+            blended += shifted
+            blended >>= 8
+
+            np.copyto(out[region], blended, casting="unsafe")
+
+        return out
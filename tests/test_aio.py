@@ -0,0 +1,101 @@
+import socket
+import time
+
+from dct.stream.aio import AsyncHTTPRequestHandler
+from dct.stream.broadcaster import Broadcaster
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def serve(**kwargs):
+    handler = AsyncHTTPRequestHandler(0, **kwargs)
+    broadcaster = Broadcaster(source=None, key="0/live")
+    broadcaster.broadcasting = True  # Frames are broadcast by hand.
+    handler.addBroadcaster(broadcaster, key=broadcaster.key)
+
+    handler.start()
+    assert handler.ready.wait(5)
+
+    return handler, broadcaster
+
+
+def connect(handler, path, receive_buffer=None):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if receive_buffer is not None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+    sock.connect(("127.0.0.1", handler.port))
+    sock.sendall("GET {} HTTP/1.1\r\n\r\n".format(path).encode())
+    sock.settimeout(5)
+
+    return sock
+
+
+def test_stream_header_and_parts():
+    handler, broadcaster = serve()
+    sock = connect(handler, "/stream/0/live")
+
+    try:
+        wait_for(lambda: len(broadcaster.clients) == 1)
+        jpegs = [b"\xff\xd8" + bytes([i]) * 100 + b"\xff\xd9" for i in range(3)]
+        for jpeg in jpegs:
+            broadcaster.broadcast(broadcaster.prepare_frame(jpeg))
+            time.sleep(0.05)
+
+        data = b""
+        while data.count(b"\xff\xd9") < len(jpegs):
+            data += sock.recv(65536)
+
+        header, body = data.split(b"\r\n\r\n", 1)
+        assert header.startswith(b"HTTP/1.0 200 OK")
+        assert b"Content-Type: multipart/x-mixed-replace;boundary=frame" in header
+
+        parts = body.split(b"--frame\r\n")[1:]
+        assert len(parts) == len(jpegs)
+        for part, jpeg in zip(parts, jpegs):
+            part_header, payload = part.split(b"\r\n\r\n", 1)
+            assert b"Content-length: %d" % len(jpeg) in part_header
+            assert payload == jpeg + b"\r\n"
+    finally:
+        sock.close()
+        handler.stop()
+
+
+def test_slow_reader_skipped_or_dropped():
+    handler, broadcaster = serve(write_buffer_limit=16 * 1024, write_timeout=0.5)
+    sock = connect(handler, "/stream/0/live", receive_buffer=4096)
+
+    try:
+        wait_for(lambda: len(broadcaster.clients) == 1)
+        client = broadcaster.clients[0]
+
+        # The reader never reads, its buffers fill up far beyond the write buffer limit.
+        jpeg = b"\xff\xd8" + b"x" * 256 * 1024 + b"\xff\xd9"
+        for _ in range(40):
+            broadcaster.broadcast(broadcaster.prepare_frame(jpeg))
+            time.sleep(0.05)
+
+        wait_for(lambda: client.skipped > 0 or not client.connected)
+    finally:
+        sock.close()
+        handler.stop()
+
+
+def test_stop_closes_open_connections():
+    handler, broadcaster = serve()
+    sock = connect(handler, "/stream/0/live")
+
+    try:
+        wait_for(lambda: len(broadcaster.clients) == 1)
+        handler.stop()
+        handler.clientThread.join(5)
+
+        assert not handler.clientThread.is_alive()
+        assert handler.loop.is_closed()
+        wait_for(lambda: sock.recv(65536) == b"")
+    finally:
+        sock.close()
@@ -0,0 +1,15 @@
+import json
+
+from dct.bench import suite
+
+
+def test_report_is_stable_json():
+    report = suite.run(["mjpeg_parse", "broadcaster_fan_out"], iterations=2)
+
+    assert report["schema"] == suite.REPORT_SCHEMA
+    assert sorted(report["results"]) == ["broadcaster_fan_out", "mjpeg_parse"]
+    for result in report["results"].values():
+        assert {"unit", "iterations", "median", "mean", "p90", "min"} <= set(result)
+
+    baseline = json.loads(json.dumps(report))
+    assert suite.compare(report, baseline) == {"mjpeg_parse": 1.0, "broadcaster_fan_out": 1.0}
@@ -0,0 +1,32 @@
+import numpy as np
+
+from dct.visualizations.util import AlphaBlender
+
+
+def test_matches_float_blend():
+    rng = np.random.RandomState(0)
+    frame = rng.randint(0, 256, (40, 30, 3), dtype=np.uint8)
+    overlay = rng.randint(0, 256, (40, 30, 4), dtype=np.uint8)
+    overlay[10:25, :, 3] = 0
+    overlay[:, 20:, 3] = 0
+
+    alpha = overlay[:, :, 3:4] / 255.0
+    expected = np.round(overlay[:, :, :3] * alpha + frame * (1 - alpha))
+
+    blender = AlphaBlender(overlay, band_height=8)
+    out = np.zeros_like(frame)
+
+    assert blender.blend(frame, out=out) is out
+    assert np.abs(out.astype(int) - expected).max() <= 1
+    assert blender.coverage < 1.0
+
+
+def test_blends_in_place():
+    frame = np.full((8, 8, 3), 100, dtype=np.uint8)
+    overlay = np.zeros((8, 8, 4), dtype=np.uint8)
+    overlay[:2, :2] = (200, 200, 200, 255)
+
+    AlphaBlender(overlay).blend(frame, out=frame)
+
+    assert (frame[:2, :2] == 200).all()
+    assert (frame[2:] == 100).all()
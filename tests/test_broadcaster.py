@@ -0,0 +1,28 @@
+import time
+
+from dct.camera.frame import Frame
+from dct.camera.stream import BaseStream, LatestFrameConsumer
+from dct.stream.broadcaster import Broadcaster
+from dct.visualizations.base import BaseFrameVisualizer
+
+
+def test_idle_broadcaster_stops():
+    stream = BaseStream()
+    consumer = LatestFrameConsumer()
+    stream.subscribe(consumer)
+
+    broadcaster = Broadcaster(BaseFrameVisualizer(consumer, width=8, height=8), key="idle")
+    broadcaster.start()
+
+    jpeg = broadcaster.source.placeholder()
+    broadcaster.kill = True
+
+    # Frames keep arriving while nobody is watching.
+    deadline = time.time() + 5
+    sequence = 0
+    while broadcaster.broadcastThread.is_alive() and time.time() < deadline:
+        stream.publish_frame(Frame(jpeg, time.time(), sequence))
+        sequence += 1
+        time.sleep(0.05)
+
+    assert not broadcaster.broadcastThread.is_alive()
@@ -0,0 +1,168 @@
+import gc
+import hashlib
+import os
+import shlex
+import shutil
+import types
+import weakref
+
+import pytest
+
+from dct.bench.model import BENCH_MODEL_PATH
+from dct.util.cache import GraphCache, ModelCache
+from dct.util.model import Model, tf
+from dct.visualizations.gradcam import GradCam
+
+
+class FakeSftp:
+    """Serves model directories from a local directory, counting transfers."""
+
+    def __init__(self, root):
+        self.root = root
+        self.downloads = 0
+        self.checksums = 0
+        self.checksum = None  # Reported instead of the real checksum when set.
+
+    def local(self, path):
+        return os.path.join(self.root, path.lstrip("/"))
+
+    def stat(self, path):
+        stat = os.stat(self.local(path))
+        return types.SimpleNamespace(st_size=stat.st_size, st_mtime=int(stat.st_mtime))
+
+    def execute(self, command):
+        self.checksums += 1
+        path = shlex.split(command)[1]
+        with open(self.local(path), "rb") as f:
+            digest = self.checksum or hashlib.sha1(f.read()).hexdigest()
+
+        return ["{}  {}\n".format(digest, path).encode()]
+
+    def get(self, remote, local):
+        self.downloads += 1
+        shutil.copyfile(self.local(remote), local)
+
+
+def add_model(root, name, payload):
+    directory = os.path.join(root, name)
+    os.makedirs(directory)
+    with open(os.path.join(directory, "model.pb"), "wb") as f:
+        f.write(payload)
+    with open(os.path.join(directory, "model_metadata.json"), "w") as f:
+        f.write("{}")
+
+    return "/" + name
+
+
+@pytest.fixture
+def sftp(tmp_path):
+    return FakeSftp(str(tmp_path / "car"))
+
+
+def test_directory_created_on_first_download(tmp_path, sftp):
+    cache = ModelCache(path=str(tmp_path / "cache"))
+    assert not os.path.exists(cache.path)
+
+    cache.fetch(sftp, "car", add_model(sftp.root, "model", b"graph"))
+    assert cache.contains(hashlib.sha1(b"graph").hexdigest())
+
+
+def test_cached_digest_not_downloaded_again(tmp_path, sftp):
+    remote = add_model(sftp.root, "model", b"graph")
+    cache = ModelCache(path=str(tmp_path / "cache"))
+
+    digest = cache.fetch(sftp, "car", remote)
+    assert digest == hashlib.sha1(b"graph").hexdigest()
+    assert cache.contains(digest)
+    assert sftp.downloads == 2
+
+    assert cache.fetch(sftp, "car", remote) == digest
+    assert sftp.downloads == 2
+
+
+def test_quote_in_model_path(tmp_path, sftp):
+    remote = add_model(sftp.root, "it's a model", b"graph")
+    cache = ModelCache(path=str(tmp_path / "cache"))
+
+    assert cache.fetch(sftp, "car", remote) == hashlib.sha1(b"graph").hexdigest()
+    assert sftp.checksums == 1
+
+
+def test_checksum_mismatch_leaves_nothing_behind(tmp_path, sftp):
+    remote = add_model(sftp.root, "model", b"graph")
+    sftp.checksum = "0" * 40
+    cache = ModelCache(path=str(tmp_path / "cache"))
+
+    with pytest.raises(Exception, match="Checksum mismatch"):
+        cache.fetch(sftp, "car", remote)
+
+    assert os.listdir(cache.path) == ["index.json"]
+
+
+def test_index_persists_across_instances(tmp_path, sftp):
+    remote = add_model(sftp.root, "model", b"graph")
+    digest = ModelCache(path=str(tmp_path / "cache")).fetch(sftp, "car", remote)
+    assert sftp.checksums == 1
+
+    cache = ModelCache(path=str(tmp_path / "cache"))
+    assert digest in cache.index.values()
+    assert cache.fetch(sftp, "car", remote) == digest
+    assert sftp.checksums == 1
+    assert sftp.downloads == 2
+
+
+def test_least_recently_used_evicted(tmp_path, sftp):
+    cache = ModelCache(path=str(tmp_path / "cache"), max_size=2500)
+
+    digests = []
+    for i in range(3):
+        digests.append(cache.fetch(sftp, "car", add_model(sftp.root, "model{}".format(i), bytes([i]) * 1000)))
+        os.utime(cache.entry(digests[-1]), (i, i))
+
+    # The third model does not fit, the least recently used one goes.
+    assert [cache.contains(digest) for digest in digests] == [False, True, True]
+
+    # A model in use is kept even if it is the least recently used.
+    cache.max_size = 1500
+    cache.evict(keep=digests[1])
+    assert [cache.contains(digest) for digest in digests] == [False, True, False]
+
+
+def tiny_model():
+    graph = tf.Graph()
+    with graph.as_default():
+        image = tf.placeholder(tf.float32, (None, 4, 4, 1))
+        tf.identity(image)
+
+    return Model(tf.Session(graph=graph), None)
+
+
+def test_evicted_graphs_closed_once_unused():
+    cache = GraphCache(capacity=1)
+    used, unused = tiny_model(), tiny_model()
+
+    cache.get("used", lambda: used)
+    used.retain()
+    cache.get("unused", lambda: unused)
+    assert "used" not in cache and not used.closed
+
+    cache.get("other", tiny_model)
+    assert unused.closed
+
+    used.release()
+    assert used.closed
+    with pytest.raises(Exception, match="closed"):
+        used.retain()
+
+
+def test_evicted_model_with_gradcam_garbage_collected():
+    cache = GraphCache(capacity=1)
+    model = cache.get("bench", lambda: Model.from_file(os.path.join(BENCH_MODEL_PATH, "model.pb"), None))
+    assert GradCam.for_model(model) is GradCam.for_model(model)
+
+    ref = weakref.ref(model)
+    del model
+    cache.get("other", tiny_model)
+    gc.collect()
+
+    assert ref() is None
@@ -0,0 +1,25 @@
+import types
+
+import numpy as np
+
+from dct.visualizations.hud import HudOverlay
+
+
+def render(car, width, height):
+    hud = HudOverlay(car)
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+
+    return hud.frame(frame)
+
+
+def test_speed_and_driving_state_visible_at_reduced_resolution():
+    car = types.SimpleNamespace(name="car", model_name=None, car_driving=None, throttle=None)
+    plain = render(car, 240, 176)
+
+    car.car_driving, car.throttle = True, 50.0
+    hud = render(car, 240, 176)
+
+    # Both texts are drawn into the bottom bar of the smaller frame.
+    changed = np.nonzero((hud != plain).any(axis=2).any(axis=1))[0]
+    assert changed.min() >= 176 - 54
+    assert changed.max() > 176 - 28
@@ -0,0 +1,56 @@
+import time
+import types
+
+from dct.util.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+
+def test_exposition_format():
+    registry = MetricsRegistry()
+    frames = Counter("frames_total", "Frames.", ["car"], registry=registry)
+    depth = Gauge("depth", "Depth.", ["stream", "consumer"], registry=registry)
+
+    frames.labels('Car "1"').inc(3)
+    queue = [1, 2]
+    depth.labels("car", 0).set_function(lambda: len(queue))
+
+    assert registry.expose().splitlines() == [
+        "# HELP frames_total Frames.",
+        "# TYPE frames_total counter",
+        'frames_total{car="Car \\"1\\""} 3.0',
+        "# HELP depth Depth.",
+        "# TYPE depth gauge",
+        'depth{stream="car",consumer="0"} 2.0',
+    ]
+
+
+def test_histogram_buckets_cumulative():
+    registry = MetricsRegistry()
+    latency = Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0), registry=registry)
+
+    child = latency.labels()
+    for value in (0.05, 0.1, 0.5, 2.0):
+        child.observe(value)
+
+    samples = {suffix + str(dict(labels).get("le", "")): value for suffix, labels, value in latency.samples()}
+    assert samples == {
+        "_bucket0.1": 2,
+        "_bucket1.0": 3,
+        "_bucket+Inf": 4,
+        "_sum": 2.65,
+        "_count": 4,
+    }
+
+
+def test_gradcam_overlay_gauges():
+    from dct.util.metrics import REGISTRY
+    from dct.visualizations.gradcam import GradCamOverlay
+
+    car = types.SimpleNamespace(name="Metrics car", model_name=None, model_listeners=[])
+    overlay = GradCamOverlay(car)
+    overlay.deliver(heatmap=None, submitted=time.time() - 2, latency=0.25)
+
+    exposed = REGISTRY.expose()
+    assert 'dct_gradcam_latency_seconds{car="Metrics car"} 0.25' in exposed
+
+    age = [line for line in exposed.splitlines() if line.startswith('dct_gradcam_heatmap_age_seconds{car="Metrics car"}')]
+    assert float(age[0].split()[-1]) >= 2
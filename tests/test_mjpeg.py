@@ -0,0 +1,56 @@
+from dct.camera.mjpeg import MJPEGParser
+
+
+def jpeg(payload):
+    return b"\xff\xd8" + payload + b"\xff\xd9"
+
+
+def part(frame, length=True):
+    header = b"--frame\r\nContent-Type: image/jpeg\r\n"
+    if length:
+        header += "Content-Length: {}\r\n".format(len(frame)).encode()
+    return header + b"\r\n" + frame + b"\r\n"
+
+
+def test_returns_every_frame_in_chunk():
+    frames = [jpeg(b"one"), jpeg(b"two"), jpeg(b"three")]
+    parser = MJPEGParser()
+
+    assert parser.feed(b"".join(part(f, length=False) for f in frames)) == frames
+
+
+def test_markers_split_across_chunks():
+    frames = [jpeg(b"first"), jpeg(b"second")]
+    data = b"".join(part(f, length=False) for f in frames)
+    parser = MJPEGParser()
+
+    out = []
+    for i in range(len(data)):
+        out.extend(parser.feed(data[i : i + 1]))
+
+    assert out == frames
+    assert len(parser.buffer) <= 2
+
+
+def test_content_length_allows_embedded_end_marker():
+    # A thumbnail inside the frame contains an end of image marker.
+    frame = jpeg(b"exif" + jpeg(b"thumb") + b"rest")
+    parser = MJPEGParser()
+
+    assert parser.feed(part(frame)[:20]) == []
+    assert parser.feed(part(frame)[20:] + part(jpeg(b"next"))) == [frame, jpeg(b"next")]
+
+
+def test_wrong_content_length_falls_back_to_markers():
+    frame = jpeg(b"payload")
+    data = b"--frame\r\nContent-Length: 5\r\n\r\n" + frame + b"\r\n"
+
+    assert MJPEGParser().feed(data) == [frame]
+
+
+def test_capture_time_from_part_header():
+    data = b"--frame\r\nX-Timestamp: 1700000000.250000\r\n\r\n" + jpeg(b"one") + b"\r\n" + part(jpeg(b"two"))
+    parser = MJPEGParser()
+
+    assert parser.feed(data) == [jpeg(b"one"), jpeg(b"two")]
+    assert parser.capture_times == [1700000000.25, None]
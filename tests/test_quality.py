@@ -0,0 +1,51 @@
+from dct.camera.quality import QualityController, SourceSettings, quality_ladder
+
+
+def feed(controller, start, seconds, fps):
+    """Frames at a steady rate, returns the settings changes and the end time."""
+    changes = []
+    timestamp = start
+    while timestamp < start + seconds:
+        settings = controller.observe(timestamp)
+        if settings is not None:
+            changes.append(settings)
+            controller.connected()
+        timestamp += 1.0 / fps
+
+    return changes, timestamp
+
+
+def test_ladder_lowers_quality_before_resolution():
+    ladder = quality_ladder(480, 360, 50, min_quality=20, min_scale=0.5)
+
+    assert ladder[0] == SourceSettings(480, 360, 50)
+    assert [s.quality for s in ladder] == [50, 37, 27, 20, 20, 20]
+    assert ladder[-1] == SourceSettings(240, 176, 20)
+
+
+def test_steps_down_when_degraded_and_back_up_after_recovery():
+    controller = QualityController(quality_ladder(480, 360, 50), min_fps=10, patience=2, recover_time=5)
+
+    changes, now = feed(controller, 0.0, 5, fps=15)
+    assert changes == []
+
+    changes, now = feed(controller, now, 6, fps=5)
+    assert [s.quality for s in changes] == [37, 27]
+
+    changes, now = feed(controller, now, 8, fps=15)
+    assert [s.quality for s in changes] == [37]
+
+
+def test_failed_step_up_waits_longer():
+    controller = QualityController(quality_ladder(480, 360, 50), min_fps=10, patience=1, recover_time=2)
+
+    _, now = feed(controller, 0.0, 3, fps=15)
+    _, now = feed(controller, now, 2, fps=5)
+    _, now = feed(controller, now, 3, fps=15)
+    assert controller.stepped_up is not None
+    level = controller.level
+
+    # Degrades again right after the step up.
+    _, now = feed(controller, now, 1.5, fps=5)
+    assert controller.level == level + 1
+    assert controller.recover_time == 4
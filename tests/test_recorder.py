@@ -0,0 +1,54 @@
+import numpy as np
+
+from dct.camera.frame import Frame
+from dct.camera.recorder import (
+    TELEMETRY_DTYPE,
+    StreamRecorder,
+    list_segments,
+    read_index,
+    segment_paths,
+)
+from dct.util.telemetry import TelemetrySeries
+
+
+def test_frames_recorded_in_segments(tmp_path):
+    series = TelemetrySeries()
+    series.append(0.0, throttle=50.0)
+
+    recorder = StreamRecorder(str(tmp_path), segment_size=25)
+    recorder.start()
+
+    frames = [Frame(bytes([i]) * 10, float(i + 1), i, series) for i in range(5)]
+    for frame in frames:
+        recorder.notify(frame)
+    recorder.notify(None)
+    recorder.close()
+
+    assert recorder.recorded == 5
+
+    recorded = []
+    for number in list_segments(str(tmp_path)):
+        segment_path, index_path, telemetry_path = segment_paths(str(tmp_path), number)
+        with open(segment_path, "rb") as f:
+            data = f.read()
+
+        index = read_index(index_path)
+        telemetry = np.fromfile(telemetry_path, dtype=TELEMETRY_DTYPE)
+
+        assert len(data) <= 30
+        assert telemetry["throttle"].tolist() == [50.0] * len(index)
+        assert np.isnan(telemetry["battery"]).all()
+
+        for timestamp, offset, length in index.tolist():
+            recorded.append((timestamp, data[offset : offset + length]))
+
+    assert recorded == [(frame.timestamp, frame.jpeg) for frame in frames]
+
+
+def test_frames_dropped_when_writer_behind(tmp_path):
+    recorder = StreamRecorder(str(tmp_path), max_pending=2)
+
+    for i in range(4):
+        recorder.notify(Frame(b"x", float(i), i))
+
+    assert recorder.dropped == 2
@@ -0,0 +1,43 @@
+import cv2
+import numpy as np
+
+from dct.camera.frame import Frame
+from dct.camera.recorder import StreamRecorder
+from dct.camera.replay import ReplayStream
+from dct.camera.stream import StreamConsumer
+from dct.util.telemetry import TelemetrySeries
+
+
+def record(directory, count, segment_size=256 * 1024 ** 2):
+    series = TelemetrySeries()
+    series.append(0.0, throttle=25.0, driving=True)
+
+    recorder = StreamRecorder(directory, segment_size=segment_size)
+    recorder.start()
+
+    frames = []
+    for i in range(count):
+        image = np.full((24, 32, 3), i % 25 * 10, dtype=np.uint8)
+        frames.append(Frame(cv2.imencode(".jpg", image)[1].tobytes(), 1.0 + i / 100, i, series))
+        recorder.notify(frames[-1])
+
+    recorder.close()
+    return frames
+
+
+def test_replay_as_fast_as_possible(tmp_path):
+    frames = record(str(tmp_path), 10, segment_size=2000)
+
+    stream = ReplayStream(str(tmp_path), speed=0)
+    consumer = StreamConsumer()
+    stream.subscribe(consumer)
+    stream.start()
+
+    replayed = list(consumer.frame_iterator())
+
+    assert len(stream.segments) > 1
+    assert (stream.width, stream.height) == (32, 24)
+    assert [bytes(frame.jpeg) for frame in replayed] == [frame.jpeg for frame in frames]
+    assert [frame.sequence for frame in replayed] == list(range(10))
+    assert replayed[0].telemetry.throttle == 25.0
+    assert replayed[0].image.shape == (24, 32, 3)
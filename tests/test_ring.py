@@ -0,0 +1,32 @@
+import threading
+
+import pytest
+
+from dct.util.ring import RingBuffer
+
+
+def test_overwrites_oldest_items():
+    ring = RingBuffer(3)
+    for i in range(5):
+        assert ring.append(i) == i
+
+    assert len(ring) == 3
+    assert ring.tail == 2
+    assert [ring.get(s) for s in range(ring.tail, ring.head)] == [2, 3, 4]
+    assert ring.latest() == (4, 4)
+
+    with pytest.raises(IndexError):
+        ring.get(1)
+
+    with pytest.raises(IndexError):
+        ring.get(5)
+
+
+def test_wait_for_sequence():
+    ring = RingBuffer(2)
+    assert ring.latest() == (-1, None)
+    assert not ring.wait(0, timeout=0.01)
+
+    threading.Timer(0.01, ring.append, args=("frame",)).start()
+    assert ring.wait(0, timeout=1)
+    assert ring.get(0) == "frame"
@@ -0,0 +1,39 @@
+from dct.util.roslog import DrivingEvent, ModelEvent, ThrottleEvent, RosLogParser
+
+LOG = (
+    b'"Camera frame published"\n---\n'
+    b"\"Model 'center-line' is installed\"\n---\n"
+    b'"Inference task (pid: 1234) has started"\n---\n'
+    b'"Setting throttle to 0.450000"\n---\n'
+    b'"Inference task (pid: 1234) has stopped"\n---\n'
+)
+
+
+def test_events_in_order():
+    events = RosLogParser().feed(LOG, timestamp=1.0)
+
+    assert events == [
+        ModelEvent(1.0, "center-line"),
+        DrivingEvent(1.0, True),
+        ThrottleEvent(1.0, 45.0),
+        DrivingEvent(1.0, False),
+    ]
+
+
+def test_lines_split_across_chunks():
+    parser = RosLogParser()
+    received = []
+    parser.subscribe(received.append)
+
+    for i in range(len(LOG)):
+        parser.feed(LOG[i : i + 1], timestamp=1.0)
+
+    assert received == RosLogParser().feed(LOG, timestamp=1.0)
+    assert len(parser.buffer) == 0
+
+
+def test_long_partial_line_discarded():
+    parser = RosLogParser(max_line_length=16)
+
+    assert parser.feed(b"x" * 32) == []
+    assert len(parser.buffer) == 0
@@ -0,0 +1,32 @@
+import socket
+
+import requests
+
+from dct.camera.mjpeg import MJPEGParser
+from dct.util.roslog import ModelEvent, RosLogParser
+from dct.util.simulator import SimulatedCar
+
+
+def test_simulated_car_serves_feed_api_and_log():
+    car = SimulatedCar("Test", 0, 0, fps=50)
+    car.start()
+
+    try:
+        base_url = "http://127.0.0.1:{}".format(car.port)
+        assert requests.get(base_url + "/api/get_battery_level").json()["battery_level"] == 10
+
+        response = requests.get(base_url + "/route?width=64&height=48&quality=50", stream=True)
+        parser = MJPEGParser()
+        frames = []
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            frames.extend(parser.feed(chunk))
+            if len(frames) >= 2:
+                break
+        response.close()
+        assert frames[0].startswith(b"\xff\xd8")
+
+        with socket.create_connection(("127.0.0.1", car.log_port)) as sock:
+            events = RosLogParser().feed(sock.recv(4096))
+        assert events[0] == ModelEvent(events[0].timestamp, "simulated-model")
+    finally:
+        car.stop()
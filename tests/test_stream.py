@@ -0,0 +1,89 @@
+import types
+
+import pytest
+
+from dct.camera import stream as stream_module
+from dct.camera.stream import DeepRacerMJPEGStream
+from dct.util.telemetry import TelemetrySeries
+
+JPEG = b"\xff\xd8" + b"x" * 100 + b"\xff\xd9"
+PART = b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n%s\r\n" % (len(JPEG), JPEG)
+
+
+class Stop(BaseException):
+    pass
+
+
+class FakeClock:
+    """Time of the stream module, sleeping records the delay and advances the clock."""
+
+    def __init__(self, sleeps):
+        self.now = 0.0
+        self.sleeps = []
+        self.last_frames = []  # Sequence of the last received frame per sleep.
+        self.stream = None
+        self.max_sleeps = sleeps
+
+    def time(self):
+        return self.now
+
+    def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.last_frames.append(self.stream.sequence - 1)
+        self.now += delay
+        if len(self.sleeps) == self.max_sleeps:
+            raise Stop()
+
+
+class FakeResponse:
+    """Camera feed at 5 frames per second of the fake clock, too slow for min_fps."""
+
+    def __init__(self, clock):
+        self.clock = clock
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        while True:
+            self.clock.now += 0.2
+            yield PART
+
+    def close(self):
+        pass
+
+
+class FakeConsumer:
+    def __init__(self):
+        self.frames = []
+
+    def notify(self, frame):
+        self.frames.append(frame)
+
+    def depth(self):
+        return 0
+
+
+def test_same_settings_reconnects_back_off(monkeypatch):
+    clock = FakeClock(sleeps=4)
+    monkeypatch.setattr(stream_module, "time", clock)
+
+    car = types.SimpleNamespace(
+        name="stream-test",
+        connected=True,
+        telemetry=TelemetrySeries(16),
+        camera_feed=lambda *settings: "feed",
+        session=types.SimpleNamespace(get=lambda url, stream, timeout: FakeResponse(clock)),
+    )
+    stream = clock.stream = DeepRacerMJPEGStream(car, adaptive=False)
+    consumer = FakeConsumer()
+    stream.subscribe(consumer)
+
+    with pytest.raises(Stop):
+        stream.process_frames()
+
+    assert clock.sleeps == [0.5, 1.0, 2.0, 4.0]
+
+    # The frame which completed the degraded window is published before reconnecting.
+    published = {frame.sequence for frame in consumer.frames}
+    assert set(clock.last_frames) <= published
@@ -0,0 +1,46 @@
+import math
+
+from dct.util.telemetry import TelemetrySeries
+
+
+def test_oldest_samples_overwritten():
+    series = TelemetrySeries(capacity=4)
+    for i in range(6):
+        series.append(float(i), throttle=i * 10.0, driving=True)
+
+    columns = series.columns()
+    assert len(series) == 4
+    assert columns["timestamp"].tolist() == [2.0, 3.0, 4.0, 5.0]
+    assert columns["throttle"].tolist() == [20.0, 30.0, 40.0, 50.0]
+
+
+def test_range_query_downsampled():
+    series = TelemetrySeries(capacity=100)
+    for i in range(100):
+        series.append(float(i), throttle=float(i))
+
+    result = series.query(start=10, end=60, points=6)
+    assert result["timestamp"] == [10.0, 20.0, 30.0, 40.0, 50.0, 60.0]
+    assert result["battery"] == [None] * 6
+
+
+def test_timestamps_kept_sorted():
+    series = TelemetrySeries(capacity=4)
+    series.append(2.0, battery=9)
+    series.append(1.0, battery=8)
+
+    assert series.columns()["timestamp"].tolist() == [2.0, 2.0]
+    assert not math.isnan(series.columns()["battery"][1])
+
+
+def test_sample_at_timestamp_after_wraparound():
+    series = TelemetrySeries(capacity=4)
+    for i in range(6):
+        series.append(float(i * 10), throttle=float(i))
+
+    assert series.at(5.0) is None
+    assert series.at(20.0).throttle == 2.0
+    assert series.at(35.0).throttle == 3.0
+    assert series.at(45.0).throttle == 4.0
+    assert series.at(100.0).throttle == 5.0
+    assert series.at(100.0).battery is None
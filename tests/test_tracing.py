@@ -0,0 +1,56 @@
+import time
+
+from dct.camera.frame import Frame
+from dct.camera.stream import BaseStream, LatestFrameConsumer
+from dct.stream.broadcaster import Broadcaster
+from dct.stream.streaming import StreamingClient
+from dct.util import tracing
+from dct.util.tracing import FrameTrace, Tracer
+from dct.visualizations.base import BaseFrameVisualizer
+
+
+def test_summary_per_hop():
+    tracer = Tracer()
+    for i in range(10):
+        trace = FrameTrace(capture=99.9, times=[100.0, 100.001, 100.002, 100.01, 100.02, 100.021])
+        tracer.record("0/live", trace, 100.03, 100.05)
+
+    summary = tracer.summary()["streams"]["0/live"]
+    assert summary["frames"] == 10
+    assert round(summary["hops"]["render_end"]["p50"], 3) == 10.0
+    assert round(summary["hops"]["sent"]["p99"], 3) == 20.0
+    assert round(summary["total"]["max"], 3) == 50.0
+    assert round(summary["glass_to_glass"]["p50"], 3) == 150.0
+
+
+def test_frame_traced_to_client():
+    tracing.TRACER.enable()
+    tracing.TRACER.reset()
+
+    try:
+        stream = BaseStream()
+        consumer = LatestFrameConsumer()
+        stream.subscribe(consumer)
+
+        broadcaster = Broadcaster(BaseFrameVisualizer(consumer, width=8, height=8), key="traced")
+        client = StreamingClient()
+        broadcaster.addClient(client)
+        client.start()
+        broadcaster.start()
+
+        jpeg = broadcaster.source.placeholder()
+        for sequence in range(20):
+            now = time.time()
+            trace = tracing.TRACER.start(capture=now - 0.1, received=now, extracted=now)
+            stream.publish_frame(Frame(jpeg, now, sequence, trace=trace))
+            time.sleep(0.01)
+
+            if "traced" in tracing.TRACER.summary()["streams"]:
+                break
+
+        summary = tracing.TRACER.summary()["streams"]["traced"]
+        assert all(summary["hops"][hop] is not None for hop in tracing.HOPS[1:])
+        assert summary["glass_to_glass"]["p50"] >= 100
+    finally:
+        tracing.TRACER.disable()
+        tracing.TRACER.reset()